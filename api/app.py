@@ -4,6 +4,7 @@ Routes only — all logic lives in src/
 """
 import sys
 import os
+import atexit
 
 # Add project root to path so we can import src modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -11,11 +12,25 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from flask import Flask, request, jsonify
 from src.retriever import Retriever
 from src.generator import generate_answer
+from src.query_expander import cache_stats as expansion_cache_stats
+from src.semantic_cache import SemanticCache
+from src.vectorstore import load_meta
 
 app = Flask(__name__)
 
 # Initialize retriever once on startup
 retriever = Retriever()
+
+# Answers for questions that mean the same thing as a recent one
+# (a snapshot from before the last re-ingestion is discarded)
+answer_cache = SemanticCache(
+    dim=retriever.embeddings.shape[1],
+    store_version=load_meta().get("store_version", 0)
+)
+answer_cache.load()
+# Only one worker writes the snapshot; the rest would overwrite it
+if answer_cache.claim_writer():
+    atexit.register(answer_cache.save)
 print("✓ API ready!")
 
 
@@ -27,8 +42,13 @@ def ask():
         "question": "How did Harry get his scar?",
         "top_k": 10,
         "use_expansion": true,
-        "use_reranker": true
+        "use_reranker": true,
+        "use_cache": true
     }
+    Response "cached" is true when the answer came from the semantic cache.
+    Each source's "also_in" lists near-duplicates folded into it as
+    {"source", "page", "doc_chunk"}; doc_chunk is the chunk's number
+    within that document, not a chunk_id (a row of the vector store).
     """
     data = request.get_json()
 
@@ -36,39 +56,57 @@ def ask():
         return jsonify({"error": "Missing 'question' field"}), 400
 
     question = data['question']
+    use_cache = data.get('use_cache', True)
     top_k = data.get('top_k', 10)
     use_expansion = data.get('use_expansion', True)
     use_reranker = data.get('use_reranker', True)
+    settings = {
+        "top_k": top_k,
+        "use_expansion": use_expansion,
+        "use_reranker": use_reranker
+    }
+
+    # Semantic cache: skip the whole pipeline for a paraphrase of a recent question
+    # (the embedding is cached by the retriever, so search() reuses it)
+    question_vector = retriever.encode_queries([question])[0]
+    cached = answer_cache.lookup(question_vector, settings) if use_cache else None
+    if cached is not None:
+        return jsonify({"question": question, **cached, "cached": True, "settings": settings})
 
     # Retrieve
+    stats = {}
     results, queries = retriever.search(
         question, top_k=top_k,
         use_expansion=use_expansion,
-        use_reranker=use_reranker
+        use_reranker=use_reranker,
+        stats=stats
     )
 
     # Generate
     answer = generate_answer(question, results)
 
-    return jsonify({
-        "question": question,
+    response = {
         "answer": answer,
         "expanded_queries": queries,
         "sources": [
             {
                 "chunk_id": r["chunk_id"],
+                "page": r.get("page"),
+                "also_in": r.get("refs", []),
                 "preview": r["text"][:200],
                 "semantic_score": r["semantic_score"],
                 "keyword_score": r["keyword_score"],
                 "rerank_score": r.get("rerank_score")
             }
             for r in results
-        ],
-        "settings": {
-            "top_k": top_k,
-            "use_expansion": use_expansion,
-            "use_reranker": use_reranker
-        }
+        ]
+    }
+    if not answer.startswith("API Error:"):
+        answer_cache.add(question_vector, settings, {**response, "cached_question": question})
+
+    return jsonify({
+        "question": question, **response,
+        "cached": False, "settings": settings, "stats": stats
     })
 
 
@@ -78,6 +116,7 @@ def search():
     Retrieval only — no answer generation
     Useful for debugging what chunks are found
     Body: {"question": "Dobby", "top_k": 5}
+    "also_in" is the same as in /ask.
     """
     data = request.get_json()
 
@@ -87,14 +126,18 @@ def search():
     question = data['question']
     top_k = data.get('top_k', 5)
 
-    results, queries = retriever.search(question, top_k=top_k)
+    stats = {}
+    results, queries = retriever.search(question, top_k=top_k, stats=stats)
 
     return jsonify({
         "question": question,
         "expanded_queries": queries,
+        "stats": stats,
         "results": [
             {
                 "chunk_id": r["chunk_id"],
+                "page": r.get("page"),
+                "also_in": r.get("refs", []),
                 "text": r["text"],
                 "semantic_score": r["semantic_score"],
                 "keyword_score": r["keyword_score"],
@@ -110,7 +153,14 @@ def health():
     return jsonify({
         "status": "ok",
         "chunks_loaded": len(retriever.chunks),
-        "embedding_dim": retriever.embeddings.shape[1]
+        "embedding_dim": retriever.embeddings.shape[1],
+        "rerank": retriever.rerank_stats(),
+        "caches": {
+            "expansion": expansion_cache_stats(),
+            "query_embeddings": retriever.query_embedding_cache.stats(),
+            "rerank_scores": retriever.rerank_cache.stats(),
+            "answers": answer_cache.stats()
+        }
     })
 
 
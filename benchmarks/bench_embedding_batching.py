@@ -0,0 +1,117 @@
+"""
+Benchmark: chunk embedding throughput by batching strategy
+
+Encodes the same chunks four ways:
+- old loop:        the previous 02_embed_chunks.py loop, 256 chunks
+                   per encode() call in corpus order, library defaults
+- fixed 256:       256 chunks per forward pass, corpus order
+- token budget:    corpus order, batches cut at TOKENS_PER_BATCH
+                   padded tokens
+- length-bucketed: sorted by token length, then cut by the same
+                   budget, results scattered back to chunk order
+
+"padding" is the share of tokens in each forward pass that are
+padding (only known for the plans we cut ourselves). "max Δ" is the
+largest difference from the old loop's vectors — order is restored,
+so it should be ~1e-6.
+
+Run from the project root:
+    python3 benchmarks/bench_embedding_batching.py
+    python3 benchmarks/bench_embedding_batching.py --limit 4000
+    python3 benchmarks/bench_embedding_batching.py --synthetic 2000
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+# Add project root to path so we can import src modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.inference import (
+    load_embedder, token_lengths, token_budget_batches, length_bucketed_batches
+)
+from src.vectorstore import load_chunks, normalize_rows
+
+TOKENS_PER_BATCH = 256 * 128
+MAX_BATCH_SIZE = 1024
+WORDS = ("the stag burst from the end of Harry's wand and galloped across "
+         "the dark lake toward the Dementors while Hermione watched").split()
+
+
+def synthetic_texts(n, seed=0):
+    """Mostly full-size chunks with short page-break fragments mixed in"""
+    rng = np.random.default_rng(seed)
+    sizes = np.where(rng.random(n) < 0.2, rng.integers(5, 40, n), rng.integers(90, 150, n))
+    return [" ".join(rng.choice(WORDS, size)) for size in sizes]
+
+
+def padding_share(batches, lengths):
+    padded = sum(len(b) * lengths[b].max() for b in batches)
+    return 1 - lengths.sum() / padded
+
+
+def run_plan(model, texts, batches):
+    """Encode each batch in one forward pass, write results at their indices"""
+    output = np.empty((len(texts), dim), dtype=np.float32)
+    start = time.perf_counter()
+    for batch in batches:
+        output[batch] = model.encode([texts[i] for i in batch], batch_size=len(batch))
+    return output, time.perf_counter() - start
+
+
+def run_old_loop(model, texts):
+    parts = []
+    start = time.perf_counter()
+    for i in range(0, len(texts), 256):
+        parts.append(model.encode(texts[i:i + 256], show_progress_bar=False))
+    return np.vstack(parts), time.perf_counter() - start
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--limit", type=int, default=2048, help="chunks from the vector store")
+parser.add_argument("--synthetic", type=int, default=0,
+                    help="use N synthetic texts instead of the vector store")
+parser.add_argument("--backend", default=None, help="torch or onnx (default: config)")
+args = parser.parse_args()
+
+print("=" * 60)
+print("BENCHMARK: EMBEDDING BATCHING STRATEGIES")
+print("=" * 60)
+
+if args.synthetic:
+    texts = synthetic_texts(args.synthetic)
+else:
+    store = load_chunks()
+    texts = [store.text(i) for i in range(min(args.limit, len(store)))]
+
+model = load_embedder(args.backend) if args.backend else load_embedder()
+dim = model.encode(["warm up"]).shape[1]
+lengths = token_lengths(model, texts)
+print(f"✓ {len(texts)} chunks, tokens per chunk: min {lengths.min()}, "
+      f"median {int(np.median(lengths))}, max {lengths.max()}\n")
+
+index = np.arange(len(texts))
+plans = {
+    "fixed 256": [index[i:i + 256] for i in range(0, len(texts), 256)],
+    "token budget": [index[s:e] for s, e in
+                     token_budget_batches(lengths, TOKENS_PER_BATCH, MAX_BATCH_SIZE)],
+    "length-bucketed": list(length_bucketed_batches(lengths, TOKENS_PER_BATCH, MAX_BATCH_SIZE)),
+}
+
+baseline, elapsed = run_old_loop(model, texts)
+baseline = normalize_rows(baseline)
+base_rate = len(texts) / elapsed
+
+print(f"{'strategy':<16} | {'batches':>7} | {'padding':>7} | {'chunks/s':>8} | "
+      f"{'speedup':>7} | {'max Δ':>8}")
+print("-" * 70)
+print(f"{'old loop':<16} | {len(plans['fixed 256']):>7} | {'—':>7} | {base_rate:>8.1f} | "
+      f"{1.0:>6.2f}× | {0.0:>8.1e}")
+for name, batches in plans.items():
+    vectors, elapsed = run_plan(model, texts, batches)
+    rate = len(texts) / elapsed
+    delta = np.abs(normalize_rows(vectors) - baseline).max()
+    print(f"{name:<16} | {len(batches):>7} | {padding_share(batches, lengths):>6.1%} | "
+          f"{rate:>8.1f} | {rate / base_rate:>6.2f}× | {delta:>8.1e}")
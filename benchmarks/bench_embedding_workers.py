@@ -0,0 +1,93 @@
+"""
+Benchmark: embedding throughput vs number of encoder processes
+
+Encodes the same chunks (length-bucketed, as 02_embed_chunks.py does)
+with EncoderPool at 1, 2, 4, 8 and 16 workers, each worker capped at
+--threads-per-worker intra-op threads. Model loading is excluded:
+every pool is warmed up before the clock starts.
+
+Scaling efficiency = throughput(N) / (N × throughput(1)). 100% means
+perfectly linear; it drops once workers outnumber physical cores or
+memory bandwidth runs out. The in-process row (one model, all cores
+as threads) is what 02_embed_chunks.py does with --workers 1.
+
+Run from the project root:
+    python3 benchmarks/bench_embedding_workers.py
+    python3 benchmarks/bench_embedding_workers.py --limit 8000 --threads-per-worker 2
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+# Add project root to path so we can import src modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.inference import load_embedder, token_lengths, length_bucketed_batches, EncoderPool
+from src.vectorstore import load_chunks
+
+WORKER_COUNTS = [1, 2, 4, 8, 16]
+TOKENS_PER_BATCH = 256 * 128
+MAX_BATCH_SIZE = 1024
+
+
+def encode_all(encode_jobs, texts, batches):
+    """Run one pass; returns (vectors in chunk order, seconds)"""
+    jobs = ((batch, [texts[i] for i in batch]) for batch in batches)
+    output = None
+    start = time.perf_counter()
+    for batch, vectors in encode_jobs(jobs):
+        if output is None:
+            output = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+        output[batch] = vectors
+    return output, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=4000, help="chunks from the vector store")
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("BENCHMARK: MULTI-PROCESS EMBEDDING")
+    print("=" * 60)
+
+    store = load_chunks()
+    texts = [store.text(i) for i in range(min(args.limit, len(store)))]
+    model = load_embedder()
+    batches = list(length_bucketed_batches(
+        token_lengths(model, texts), TOKENS_PER_BATCH, MAX_BATCH_SIZE
+    ))
+    print(f"✓ {len(texts)} chunks in {len(batches)} batches, {os.cpu_count()} CPUs\n")
+
+    def in_process(jobs):
+        for batch, batch_texts in jobs:
+            yield batch, model.encode(batch_texts, batch_size=len(batch_texts))
+
+    model.encode(texts[:8])   # warm up
+    reference, elapsed = encode_all(in_process, texts, batches)
+    print(f"{'workers':>7} | {'threads':>7} | {'chunks/s':>8} | {'speedup':>7} | "
+          f"{'efficiency':>10} | {'max Δ':>8}")
+    print("-" * 64)
+    print(f"{'in-proc':>7} | {os.cpu_count():>7} | {len(texts) / elapsed:>8.1f} | "
+          f"{'—':>7} | {'—':>10} | {0.0:>8.1e}")
+
+    single_rate = None
+    for workers in WORKER_COUNTS:
+        with EncoderPool(workers, args.threads_per_worker) as pool:
+            pool.warm_up()
+            vectors, elapsed = encode_all(pool.imap, texts, batches)
+        rate = len(texts) / elapsed
+        single_rate = single_rate or rate
+        speedup = rate / single_rate
+        delta = np.abs(vectors - reference).max()
+        note = "  (more workers than CPUs)" if workers * args.threads_per_worker > os.cpu_count() else ""
+        print(f"{workers:>7} | {args.threads_per_worker:>7} | {rate:>8.1f} | {speedup:>6.2f}× | "
+              f"{speedup / workers:>9.0%} | {delta:>8.1e}{note}")
+
+
+# Guard needed: EncoderPool spawns workers that re-import this file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark: PyTorch vs ONNX Runtime (fp32 and int8) inference
+
+For the embedding model and the re-ranker, checks that the ONNX
+outputs match PyTorch (parity) and measures latency per batch size.
+
+Parity:
+- Embeddings: cosine similarity to the PyTorch vector per text,
+  and whether the top-3 passages for a query are the same
+- Re-ranker: max absolute logit difference and whether the
+  ordering of the passages is unchanged
+
+Parity is checked against MIN_COSINE, the top-3 agreement, and
+MAX_DELTA_LOGIT; the script exits non-zero if any backend fails.
+
+Run from the project root:
+    python3 benchmarks/bench_inference_backend.py
+"""
+import os
+import sys
+import time
+import numpy as np
+
+# Add project root to path so we can import src modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import EMBEDDING_MODEL, RERANKER_MODEL, ONNX_THREADS
+from src.inference import load_embedder, load_reranker, OnnxEmbedder, OnnxCrossEncoder
+
+BATCH_SIZES = [1, 8, 32, 128]
+REPEATS = 5
+MIN_COSINE = 0.99                                          # Per text, vs torch
+MAX_DELTA_LOGIT = {"onnx-fp32": 0.01, "onnx-int8": 0.5}    # Re-ranker, vs torch
+QUERY = "what spell made a deer for harry"
+PASSAGES = [
+    "There was a silver spark, then a wavering light, and then the stag burst "
+    "from the end of Harry's wand.",
+    "Expecto Patronum! A silvery stag emerged and galloped across the lake.",
+    "Dumbledore enjoyed lemon drops and spoke of the Ministry.",
+    "Hermione raised her hand before the question was finished.",
+    "The Dementors glided closer, and the cold seeped into Harry's chest.",
+    "Ron's rat Scabbers had been in the family for twelve years.",
+    "Hagrid knocked on the door of the hut on the rock.",
+    "Snape's lessons took place down in one of the dungeons.",
+] * 16
+
+
+def time_call(fn, items, batch_size):
+    """Median ms for one call on the first batch_size items"""
+    batch = items[:batch_size]
+    fn(batch)   # warm up
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(batch)
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+
+def onnx_pair(quantize):
+    """ONNX embedder + re-ranker, exported with or without int8 weights"""
+    return (OnnxEmbedder(EMBEDDING_MODEL, quantize=quantize),
+            OnnxCrossEncoder(RERANKER_MODEL, quantize=quantize))
+
+
+print("=" * 60)
+print("BENCHMARK: INFERENCE BACKENDS")
+print("=" * 60)
+print(f"ONNX threads per session: {ONNX_THREADS}")
+
+backends = {"torch": (load_embedder("torch"), load_reranker("torch"))}
+backends["onnx-fp32"] = onnx_pair(quantize=False)
+backends["onnx-int8"] = onnx_pair(quantize=True)
+
+# ---------------------------------------------------------------
+# Parity
+# ---------------------------------------------------------------
+print("\n--- Parity vs torch ---")
+texts = [QUERY] + PASSAGES[:8]
+pairs = [[QUERY, p] for p in PASSAGES[:8]]
+ref_vectors = backends["torch"][0].encode(texts, normalize_embeddings=True)
+ref_scores = np.asarray(backends["torch"][1].predict(pairs))
+ref_top = set(np.argsort(-(ref_vectors[1:] @ ref_vectors[0]))[:3])
+
+print(f"{'backend':<10} | {'min cos':>8} | {'top-3 same':>10} | {'max Δlogit':>10} | {'order same':>10}")
+print("-" * 62)
+failures = []
+for name in ["onnx-fp32", "onnx-int8"]:
+    embedder, reranker = backends[name]
+    vectors = embedder.encode(texts, normalize_embeddings=True)
+    cosines = np.sum(vectors * ref_vectors, axis=1)
+    top = set(np.argsort(-(vectors[1:] @ vectors[0]))[:3])
+    scores = np.asarray(reranker.predict(pairs))
+    same_order = bool(np.array_equal(np.argsort(-scores), np.argsort(-ref_scores)))
+    delta = np.abs(scores - ref_scores).max()
+    print(f"{name:<10} | {cosines.min():>8.4f} | {str(top == ref_top):>10} | "
+          f"{delta:>10.4f} | {str(same_order):>10}")
+
+    if cosines.min() < MIN_COSINE:
+        failures.append(f"{name}: min cosine {cosines.min():.4f} < {MIN_COSINE}")
+    if top != ref_top:
+        failures.append(f"{name}: top-3 passages differ from torch")
+    if delta > MAX_DELTA_LOGIT[name]:
+        failures.append(f"{name}: max Δlogit {delta:.4f} > {MAX_DELTA_LOGIT[name]}")
+
+# ---------------------------------------------------------------
+# Latency
+# ---------------------------------------------------------------
+for label, index, make_fn, items in [
+    ("ENCODE", 0, lambda m: (lambda b: m.encode(b, normalize_embeddings=True)), PASSAGES),
+    ("RE-RANK", 1, lambda m: m.predict, [[QUERY, p] for p in PASSAGES]),
+]:
+    print(f"\n--- {label} latency (ms per call) ---")
+    print(f"{'batch':>5} | " + " | ".join(f"{name:>10}" for name in backends) + " | int8 speedup")
+    print("-" * 60)
+    for batch_size in BATCH_SIZES:
+        row = {name: time_call(make_fn(models[index]), items, batch_size)
+               for name, models in backends.items()}
+        print(f"{batch_size:>5} | " + " | ".join(f"{row[name]:>10.1f}" for name in backends)
+              + f" | {row['torch'] / row['onnx-int8']:>11.2f}×")
+
+print()
+if failures:
+    print("✗ Parity check failed:")
+    for failure in failures:
+        print(f"  - {failure}")
+    sys.exit(1)
+print("✓ Parity within tolerance for all backends")
@@ -0,0 +1,93 @@
+"""
+Benchmark: throughput vs latency with and without micro-batching
+
+Simulates concurrent /ask traffic on the model side only: every
+request encodes 4 query phrasings and re-ranks 30 (query, passage)
+pairs. Each concurrency level runs once calling the models directly
+(every request is its own tiny batch) and once through MicroBatcher
+(concurrent requests share batches).
+
+Run from the project root:
+    python3 benchmarks/bench_microbatching.py
+"""
+import os
+import sys
+import time
+import threading
+import numpy as np
+
+# Add project root to path so we can import src modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sentence_transformers import SentenceTransformer, CrossEncoder
+from src.config import EMBEDDING_MODEL, RERANKER_MODEL
+from src.retriever import MicroBatcher
+
+REQUESTS_PER_LEVEL = 64
+PHRASINGS = [
+    "what spell made a deer for harry",
+    "Expecto Patronum conjured a silver deer",
+    "Harry's patronus took the shape of a stag",
+    "A silvery stag emerged from Harry's wand",
+]
+PASSAGE = ("There was a silver spark, then a wavering light, and then, with the "
+           "greatest effort it had ever cost him, the stag burst from the end of "
+           "Harry's wand. ") * 3
+PAIRS = [[PHRASINGS[0], PASSAGE[i:]] for i in range(30)]
+
+
+def encode(texts):
+    return embed_model.encode(texts, normalize_embeddings=True)
+
+
+def run_level(concurrency, do_encode, do_rerank):
+    """Fire REQUESTS_PER_LEVEL requests from `concurrency` threads"""
+    latencies = []
+    lock = threading.Lock()
+    per_thread = REQUESTS_PER_LEVEL // concurrency
+
+    def worker():
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            do_encode(PHRASINGS)
+            do_rerank(PAIRS)
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+print("=" * 60)
+print("BENCHMARK: MICRO-BATCHING UNDER CONCURRENT LOAD")
+print("=" * 60)
+
+embed_model = SentenceTransformer(EMBEDDING_MODEL)
+reranker = CrossEncoder(RERANKER_MODEL)
+encode_batcher = MicroBatcher(encode, name="encode-batcher")
+rerank_batcher = MicroBatcher(reranker.predict, name="rerank-batcher")
+
+# Warm up both models
+encode(PHRASINGS)
+reranker.predict(PAIRS)
+
+print(f"\n{REQUESTS_PER_LEVEL} requests per level "
+      f"(4 phrasings encoded + {len(PAIRS)} pairs re-ranked each)\n")
+print(f"{'threads':>7} | {'mode':<8} | {'req/s':>7} | {'p50 ms':>8} | {'p95 ms':>8}")
+print("-" * 50)
+for concurrency in [1, 2, 4, 8, 16, 32]:
+    for mode, do_encode, do_rerank in [
+        ("direct", encode, reranker.predict),
+        ("batched", encode_batcher.submit, rerank_batcher.submit),
+    ]:
+        throughput, p50, p95 = run_level(concurrency, do_encode, do_rerank)
+        print(f"{concurrency:>7} | {mode:<8} | {throughput:>7.1f} | {p50:>8.1f} | {p95:>8.1f}")
+
+print(f"\nEncode batches:  {encode_batcher.stats()}")
+print(f"Re-rank batches: {rerank_batcher.stats()}")
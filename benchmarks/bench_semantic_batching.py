@@ -0,0 +1,78 @@
+"""
+Benchmark: per-phrasing vs batched semantic search
+
+Compares the old semantic path (one encode call and one
+matrix-vector product per query phrasing) against the batched
+path (one encode call for all phrasings, one matrix product,
+max across queries) as the number of expansions grows.
+
+Run from the project root:
+    python3 benchmarks/bench_semantic_batching.py
+"""
+import os
+import sys
+import time
+import numpy as np
+
+# Add project root to path so we can import src modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sentence_transformers import SentenceTransformer
+from src.config import EMBEDDING_MODEL
+from src.vectorstore import load_embeddings
+
+REPEATS = 20
+PHRASINGS = [
+    "what spell made a deer for harry",
+    "Expecto Patronum conjured a silver deer",
+    "Harry's patronus took the shape of a stag",
+    "A silvery stag emerged from Harry's wand",
+    "the silver stag galloped toward the dementors",
+    "Harry raised his wand and cried Expecto Patronum",
+    "a Patronus charm shaped like his father's animagus form",
+    "Prongs the stag Patronus",
+]
+
+
+def per_phrasing(model, embeddings, queries):
+    scores = np.zeros(len(embeddings), dtype=np.float32)
+    for q in queries:
+        query_vector = model.encode([q], normalize_embeddings=True)[0]
+        scores = np.maximum(scores, embeddings @ query_vector)
+    return scores
+
+
+def batched(model, embeddings, queries):
+    query_vectors = model.encode(queries, normalize_embeddings=True)
+    return np.maximum((embeddings @ query_vectors.T).max(axis=1), 0)
+
+
+def median_ms(fn, *args):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+
+print("=" * 60)
+print("BENCHMARK: BATCHED SEMANTIC SEARCH")
+print("=" * 60)
+
+embeddings = load_embeddings()
+model = SentenceTransformer(EMBEDDING_MODEL)
+print(f"✓ {embeddings.shape[0]} chunks × {embeddings.shape[1]} dims, {REPEATS} repeats\n")
+
+# Warm up the model so the first timing isn't skewed
+batched(model, embeddings, PHRASINGS[:2])
+
+print(f"{'queries':>8} | {'per-phrasing ms':>15} | {'batched ms':>10} | {'speedup':>7}")
+print("-" * 50)
+for n in [1, 2, 4, 8]:
+    queries = PHRASINGS[:n]
+    assert np.allclose(per_phrasing(model, embeddings, queries),
+                       batched(model, embeddings, queries), atol=1e-4)
+    old_ms = median_ms(per_phrasing, model, embeddings, queries)
+    new_ms = median_ms(batched, model, embeddings, queries)
+    print(f"{n:>8} | {old_ms:>15.2f} | {new_ms:>10.2f} | {old_ms / new_ms:>6.2f}x")
@@ -0,0 +1,108 @@
+"""
+Benchmark: recall@k vs latency for the vector index backends
+
+Ground truth is the exact backend's top-k. Queries are stored
+chunk vectors with a little noise added, so each one has real
+neighbours in the corpus.
+
+Run from the project root:
+    python3 benchmarks/bench_vector_index.py
+    python3 benchmarks/bench_vector_index.py --synthetic 200000
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+# Add project root to path so we can import src modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.vector_index import ExactIndex, IVFIndex, Int8Index, PQIndex
+from src.vectorstore import load_embeddings, normalize_rows, quantize_int8
+
+
+def synthetic_embeddings(n, dim=384, n_topics=500, seed=0):
+    """Clustered unit vectors, roughly shaped like real chunk embeddings"""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    members = rng.integers(0, n_topics, n)
+    noise = rng.standard_normal((n, dim)).astype(np.float32)
+    return normalize_rows(topics[members] + 1.5 * noise)
+
+
+def make_queries(embeddings, n_queries, seed=1):
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(embeddings), n_queries, replace=False)
+    noise = rng.standard_normal((n_queries, embeddings.shape[1])).astype(np.float32)
+    return normalize_rows(embeddings[picks] + 0.05 * noise)
+
+
+def evaluate(index, queries, truth, k):
+    """Mean recall@k against ground truth and mean ms per query"""
+    hits = 0
+    start = time.perf_counter()
+    for query, true_ids in zip(queries, truth):
+        ids, _ = index.search(query, k)
+        hits += len(np.intersect1d(ids, true_ids))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return hits / (len(queries) * k), elapsed_ms / len(queries)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--synthetic", type=int, default=0,
+                    help="use N synthetic vectors instead of the vector store")
+parser.add_argument("--queries", type=int, default=200)
+parser.add_argument("--k", type=int, default=10)
+args = parser.parse_args()
+
+print("=" * 60)
+print("BENCHMARK: VECTOR INDEX RECALL VS LATENCY")
+print("=" * 60)
+
+if args.synthetic:
+    embeddings = synthetic_embeddings(args.synthetic)
+else:
+    embeddings = load_embeddings()
+queries = make_queries(embeddings, args.queries)
+print(f"✓ {embeddings.shape[0]} vectors × {embeddings.shape[1]} dims, "
+      f"{len(queries)} queries, k={args.k}\n")
+
+exact = ExactIndex(embeddings)
+truth = [exact.search(q, args.k)[0] for q in queries]
+
+dim = embeddings.shape[1]
+
+
+def report(label, index, bytes_per_vector):
+    recall, ms = evaluate(index, queries, truth, args.k)
+    print(f"{label:<22} | {bytes_per_vector:>9} | {recall:>8.3f} | {ms:>8.2f}")
+
+
+# bytes/vector = what a scan has to read per chunk (IVF adds list ids)
+print(f"{'backend':<22} | {'bytes/vec':>9} | {'recall@k':>8} | {'ms/query':>8}")
+print("-" * 58)
+report("exact float32", exact, 4 * dim)
+
+codes, scale = quantize_int8(embeddings)
+int8 = Int8Index(embeddings, codes, scale)
+for rescore in [0, 50, 100, 300, 1000]:
+    int8.rescore = rescore
+    report(f"int8 rescore={rescore}", int8, dim)
+
+start = time.perf_counter()
+ivf = IVFIndex.train(embeddings)
+print(f"{'(ivf train)':<22} | {'':>9} | {'':>8} | {(time.perf_counter() - start) * 1000:>8.0f} ms total")
+for nprobe in [1, 2, 4, 8, 16, 32]:
+    ivf.nprobe = nprobe
+    report(f"ivf nprobe={nprobe}", ivf, 4 * dim + 4)
+
+for m in [16, 32, 48, 96]:
+    if dim % m:
+        continue
+    start = time.perf_counter()
+    pq = PQIndex.train(embeddings, m=m)
+    print(f"{f'(pq m={m} train)':<22} | {'':>9} | {'':>8} | {(time.perf_counter() - start) * 1000:>8.0f} ms total")
+    for rerank in [0, 200]:
+        pq.rerank = rerank
+        report(f"pq m={m} rerank={rerank}", pq, m)
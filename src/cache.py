@@ -0,0 +1,155 @@
+"""
+Caches
+Small, thread-safe caches shared by the retrieval pipeline
+
+ANALOGY: The sticky notes on the librarian's desk. Questions that
+come up again and again get their answer written down, so the
+next time nobody has to walk to the shelves (or call Claude).
+
+- LRUCache: in-process, bounded, least-recently-used entries
+  are thrown out first, optional time-to-live
+- SQLiteCache: the same idea on disk, so it survives restarts
+  and is shared by every API worker process
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Bounded LRU map with optional TTL (seconds) and hit/miss counters"""
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self),
+            "maxsize": self.maxsize
+        }
+
+
+class SQLiteCache:
+    """
+    On-disk key → JSON value cache with TTL and a row limit
+
+    namespace identifies what produced the values (e.g. model name +
+    prompt hash). Rows from any other namespace are deleted when the
+    cache opens, so changing the model or prompt invalidates them.
+
+    The connection is opened lazily and re-opened after a fork, so
+    every worker process gets its own.
+    """
+
+    def __init__(self, path, namespace, max_entries, ttl=None):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    @property
+    def _db(self):
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._pid = os.getpid()
+            with self._conn:
+                self._setup(self._conn)
+        return self._conn
+
+    def _setup(self, db):
+        db.execute("""CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY, namespace TEXT, value TEXT,
+            expires_at REAL, accessed_at REAL)""")
+        db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+        db.execute("DELETE FROM cache WHERE namespace != ?", (self.namespace,))
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ? AND namespace = ?",
+                (key, self.namespace)
+            ).fetchone()
+            if row is not None and (row[1] is None or row[1] > now):
+                self._db.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return json.loads(row[0])
+            if row is not None:
+                self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, self.namespace, json.dumps(value), expires_at, now)
+            )
+            # Over the limit: drop the least recently used rows
+            self._db.execute("""DELETE FROM cache WHERE key IN (
+                SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)""",
+                (self.max_entries,))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self),
+            "maxsize": self.max_entries
+        }
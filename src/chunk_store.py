@@ -0,0 +1,173 @@
+"""
+Chunk Store
+Columnar, memory-mapped storage for chunks
+
+ANALOGY: Instead of every librarian getting their own photocopy
+of all 12,921 index cards, the cards sit on one shared shelf.
+Each librarian keeps a list of where every card starts on the
+shelf and only pulls down the cards they actually need.
+
+ON DISK (one directory, one file per column):
+- text.bin         all chunk texts as UTF-8, back to back
+- offsets.npy      byte offsets: chunk i is text.bin[offsets[i]:offsets[i + 1]]
+- start_char.npy   int64, where the chunk starts in its document
+- chunk_id.npy     int32, the chunk's number within its document
+- page.npy         int32, 1-based PDF page the chunk starts on (0 = unknown)
+- source.npy       int32 code per chunk, into...
+- sources.json     ...the list of distinct source file names
+- ref_*.npy        other places the same passage appears (near-duplicates
+                   collapsed into this chunk): ref_offsets.npy says which
+                   rows of ref_source / ref_page / ref_doc_chunk belong
+                   to chunk i, like offsets.npy does for text.
+                   doc_chunk is the chunk_id the duplicate had in its
+                   own document (not a row of this store)
+- meta.json        {"store_version": n}: the vector store build these
+                   chunks belong to (absent outside the vector store)
+
+WHY COLUMNS: a list of dicts pays Python object overhead per
+chunk and repeats the source file name 12,921 times. Columns are
+flat arrays that get memory-mapped, so N API worker processes
+share one copy in the OS page cache, and opening the store
+doesn't read the corpus at all.
+"""
+import json
+import os
+import numpy as np
+
+INT_COLUMNS = {"start_char": np.int64, "chunk_id": np.int32, "page": np.int32}
+REF_COLUMNS = {"page": np.int32, "doc_chunk": np.int32}
+
+
+def write_chunk_store(directory, chunks, store_version=None):
+    """Write an iterable of chunk dicts as a columnar chunk store"""
+    os.makedirs(directory, exist_ok=True)
+
+    offsets = [0]
+    columns = {name: [] for name in INT_COLUMNS}
+    source_codes = []
+    sources = {}
+    ref_offsets = [0]
+    ref_columns = {name: [] for name in REF_COLUMNS}
+    ref_source_codes = []
+
+    with open(os.path.join(directory, "text.bin"), "wb") as f:
+        for chunk in chunks:
+            encoded = chunk["text"].encode("utf-8")
+            f.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+            for name in INT_COLUMNS:
+                columns[name].append(chunk.get(name, 0))
+            source_codes.append(sources.setdefault(chunk["source"], len(sources)))
+            refs = chunk.get("refs", [])
+            for ref in refs:
+                for name in REF_COLUMNS:
+                    ref_columns[name].append(ref.get(name, 0))
+                ref_source_codes.append(sources.setdefault(ref["source"], len(sources)))
+            ref_offsets.append(ref_offsets[-1] + len(refs))
+
+    np.save(os.path.join(directory, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    for name, dtype in INT_COLUMNS.items():
+        np.save(os.path.join(directory, f"{name}.npy"), np.array(columns[name], dtype=dtype))
+    np.save(os.path.join(directory, "source.npy"), np.array(source_codes, dtype=np.int32))
+    np.save(os.path.join(directory, "ref_offsets.npy"), np.array(ref_offsets, dtype=np.int64))
+    for name, dtype in REF_COLUMNS.items():
+        np.save(os.path.join(directory, f"ref_{name}.npy"), np.array(ref_columns[name], dtype=dtype))
+    np.save(os.path.join(directory, "ref_source.npy"), np.array(ref_source_codes, dtype=np.int32))
+    with open(os.path.join(directory, "sources.json"), "w") as f:
+        json.dump(list(sources), f)
+    if store_version is not None:
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"store_version": store_version}, f)
+
+
+def _open_bytes(path):
+    """Memory-map a file as uint8 (mmap can't map an empty file)"""
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+class ChunkStore:
+    """
+    Read-only, list-like view of the chunks
+
+    store[i] gives the same dict chunks.pkl used to hold
+    ({"text", "source", "start_char", "chunk_id", "page"}, plus "refs"
+    when the store has them), built from the columns only when asked
+    for. Use take() to materialize just the chunks a search returns.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.blob = _open_bytes(os.path.join(directory, "text.bin"))
+        self.offsets = self._column("offsets")
+        # Stores written before a column existed simply don't have it
+        self.columns = {
+            name: self._column(name) for name in INT_COLUMNS
+            if os.path.exists(os.path.join(directory, f"{name}.npy"))
+        }
+        self.source_codes = self._column("source")
+        self.has_refs = os.path.exists(os.path.join(directory, "ref_offsets.npy"))
+        if self.has_refs:
+            self.ref_offsets = self._column("ref_offsets")
+            self.ref_source_codes = self._column("ref_source")
+            self.ref_columns = {name: self._column(f"ref_{name}") for name in REF_COLUMNS}
+        with open(os.path.join(directory, "sources.json")) as f:
+            self.sources = json.load(f)
+        self.store_version = None
+        if os.path.exists(os.path.join(directory, "meta.json")):
+            with open(os.path.join(directory, "meta.json")) as f:
+                self.store_version = json.load(f)["store_version"]
+
+    def _column(self, name):
+        return np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, "sources.json"))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def text(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def texts(self):
+        """Iterate over every chunk text in order"""
+        for i in range(len(self)):
+            yield self.text(i)
+
+    def source(self, i):
+        return self.sources[self.source_codes[i]]
+
+    def refs(self, i):
+        """Other (source, page, doc_chunk) locations of this chunk's passage"""
+        if not self.has_refs:
+            return []
+        refs = []
+        for j in range(self.ref_offsets[i], self.ref_offsets[i + 1]):
+            ref = {"source": self.sources[self.ref_source_codes[j]]}
+            for name, column in self.ref_columns.items():
+                ref[name] = int(column[j])
+            refs.append(ref)
+        return refs
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        i = int(i) % len(self)
+        chunk = {"text": self.text(i), "source": self.source(i)}
+        for name, column in self.columns.items():
+            chunk[name] = int(column[i])
+        if self.has_refs:
+            chunk["refs"] = self.refs(i)
+        return chunk
+
+    def take(self, ids):
+        """Materialize only the chunks at these row ids"""
+        return [self[i] for i in ids]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
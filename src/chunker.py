@@ -0,0 +1,155 @@
+"""
+Streaming Chunker
+Token-sized, overlapping chunks from a stream of page texts
+
+ANALOGY: The old clerk photocopied the whole book onto one endless
+scroll, then cut it every 800 letters with scissors, squinting back
+for a full stop. The new clerk reads page by page, marks each
+sentence as it goes by, and packs sentences into cards that hold
+exactly what the reader (MiniLM) can see at once — 256 tokens —
+repeating the last few sentences at the top of the next card.
+
+HOW IT WORKS:
+- Pages arrive one at a time (a generator); only the current page
+  and the sentences of the card being filled are ever in memory
+- One regex pass per page finds sentence ends; a sentence cut off
+  by a page break is carried over and finished on the next page —
+  up to MAX_SENTENCE_CHARS, so unpunctuated pages (indexes, tables,
+  OCR) can't pile up into one endless "sentence"
+- Sentences are tokenized in batches with the embedding model's own
+  tokenizer, so sizes are real token counts, not characters
+- A card is closed when the next sentence would push it past
+  max_tokens; the next card starts with the trailing sentences that
+  fit in overlap_tokens
+- A single sentence longer than max_tokens is cut at token
+  boundaries, so nothing is silently truncated by the model
+"""
+import re
+from collections import deque, namedtuple
+from src.config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+
+# End of sentence (punctuation, optional closing quote/bracket, whitespace)
+# or a blank line between paragraphs
+SENTENCE_END = re.compile(r"""[.!?]['"”’)\]]*\s+|\n\s*\n""")
+
+# Carried text is flushed as a sentence once it's this long (~8 chars
+# per token, so a couple of chunks' worth); _tokenized cuts it further
+MAX_SENTENCE_CHARS = CHUNK_MAX_TOKENS * 8
+
+Sentence = namedtuple("Sentence", ["page", "start_char", "text", "tokens"])
+
+
+def split_sentences(pages, max_chars=MAX_SENTENCE_CHARS):
+    """
+    Yield (page, start_char, text) per sentence from (page_number, text) pages
+
+    start_char counts from the start of the document, with pages
+    separated by one newline (as if they had been joined). Whitespace
+    inside a sentence, including PDF line breaks, becomes one space.
+    A sentence carried across page breaks is yielded as soon as it
+    passes max_chars, even without a sentence end.
+    """
+    offset = 0
+    carry = None   # (page, start_char, text) of a sentence cut by a page break
+    for page_number, text in pages:
+        position = 0
+        for match in SENTENCE_END.finditer(text):
+            piece = text[position:match.end()]
+            if carry is not None:
+                yield carry[0], carry[1], " ".join((carry[2] + piece).split())
+                carry = None
+            elif piece.strip():
+                yield page_number, offset + position, " ".join(piece.split())
+            position = match.end()
+
+        tail = text[position:]
+        if carry is not None:
+            carry = (carry[0], carry[1], carry[2] + tail + "\n")
+        elif tail.strip():
+            carry = (page_number, offset + position, tail + "\n")
+        if carry is not None and len(carry[2]) > max_chars:
+            yield carry[0], carry[1], " ".join(carry[2].split())
+            carry = None
+        offset += len(text) + 1
+
+    if carry is not None and carry[2].strip():
+        yield carry[0], carry[1], " ".join(carry[2].split())
+
+
+def _tokenized(sentences, tokenizer, max_tokens, batch_size=256):
+    """
+    Token-count sentences in batches; split any longer than max_tokens
+
+    The start_char of a piece split off a long sentence is approximate:
+    it's the sentence's start plus the piece's offset in the
+    whitespace-collapsed text, so it can fall short of the real
+    document offset by the whitespace that was collapsed before it.
+    """
+    batch = []
+
+    def flush():
+        encoded = tokenizer([text for _, _, text in batch], add_special_tokens=False,
+                            return_offsets_mapping=True)
+        for (page, start, text), offsets in zip(batch, encoded["offset_mapping"]):
+            if len(offsets) <= max_tokens:
+                yield Sentence(page, start, text, len(offsets))
+                continue
+            for first in range(0, len(offsets), max_tokens):
+                window = offsets[first:first + max_tokens]
+                yield Sentence(page, start + window[0][0],
+                               text[window[0][0]:window[-1][1]], len(window))
+        batch.clear()
+
+    for sentence in sentences:
+        if sentence[2]:
+            batch.append(sentence)
+        if len(batch) >= batch_size:
+            yield from flush()
+    if batch:
+        yield from flush()
+
+
+def chunk_pages(pages, tokenizer, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Yield chunk dicts {"text", "start_char", "chunk_id", "page"} from pages
+
+    pages is any iterable of (page_number, text) — typically a
+    generator, so a document is never held in memory as one string.
+    Every chunk is at most max_tokens tokens (before [CLS]/[SEP]).
+    start_char is exact for chunks that start on a sentence, and
+    approximate for ones that start inside a split over-long sentence
+    (see _tokenized).
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+
+    window = deque()
+    tokens = 0
+    chunk_id = 0
+
+    def make_chunk():
+        return {
+            "text": " ".join(s.text for s in window),
+            "start_char": window[0].start_char,
+            "chunk_id": chunk_id,
+            "page": window[0].page
+        }
+
+    for sentence in _tokenized(split_sentences(pages), tokenizer, max_tokens):
+        if window and tokens + sentence.tokens > max_tokens:
+            yield make_chunk()
+            chunk_id += 1
+            # Carry the trailing sentences that fit in the overlap
+            kept = deque()
+            kept_tokens = 0
+            while window and kept_tokens + window[-1].tokens <= overlap_tokens:
+                kept.appendleft(window.pop())
+                kept_tokens += kept[0].tokens
+            window, tokens = kept, kept_tokens
+            while window and tokens + sentence.tokens > max_tokens:
+                tokens -= window.popleft().tokens
+        window.append(sentence)
+        tokens += sentence.tokens
+
+    if window:
+        yield make_chunk()
@@ -10,16 +10,100 @@ load_dotenv()
 # API
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 ANTHROPIC_MODEL = "claude-sonnet-4-20250514"
+ANTHROPIC_API_URL = os.getenv("ANTHROPIC_API_URL", "https://api.anthropic.com")
+
+# LLM client (shared by query expansion and generation)
+LLM_TIMEOUT = (10, 30)       # (connect_timeout, read_timeout) in seconds
+LLM_MAX_RETRIES = 3          # Retries on 429/5xx and connection errors
+LLM_BACKOFF_SECONDS = 0.5    # First retry delay, doubled each attempt
+LLM_DEADLINE_SECONDS = 60    # Max time for one call, retries and waits included
+LLM_POOL_SIZE = 10           # Keep-alive connections kept open
+
+# Query expansion cache
+EXPANSION_CACHE_SIZE = 4096                         # In-process LRU entries
+EXPANSION_CACHE_TTL = 7 * 24 * 3600                 # Seconds (None = never expire)
+EXPANSION_CACHE_PATH = "data/cache/expansions.sqlite"  # On-disk tier (None = off)
+EXPANSION_CACHE_DISK_ENTRIES = 100_000              # On-disk tier size (least recently used evicted)
+
+# Semantic answer cache for /ask
+SEMANTIC_CACHE_SIZE = 1000          # Questions remembered
+SEMANTIC_CACHE_THRESHOLD = 0.95     # Min cosine similarity to reuse an answer
+SEMANTIC_CACHE_PATH = "data/cache/answers"  # Snapshot on shutdown (None = off)
+
+# Chunking (sized in the embedding model's tokens; MiniLM reads 256
+# including [CLS] and [SEP])
+CHUNK_MAX_TOKENS = 254
+CHUNK_OVERLAP_TOKENS = 48       # ≈ the old 200-character overlap
+
+# Near-duplicate chunk removal before embedding (MinHash + LSH)
+DEDUP = True
+DEDUP_THRESHOLD = 0.8        # Min estimated Jaccard similarity of 5-word shingles
+DEDUP_NUM_PERM = 128         # MinHash signature length
+DEDUP_BANDS = 16             # LSH bands (DEDUP_NUM_PERM / bands rows each)
+DEDUP_SHINGLE_WORDS = 5
 
 # Embedding
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+QUERY_EMBEDDING_CACHE_SIZE = 10000   # Query string → embedding, LRU
+RERANK_CACHE_SIZE = 100000           # (query, chunk_id) → re-rank score, LRU
+
+# Inference backend for the embedding model and re-ranker
+# "torch" = sentence-transformers (PyTorch)
+# "onnx"  = exported once to ONNX, run by onnxruntime (pip install onnxruntime onnx)
+INFERENCE_BACKEND = "torch"
+ONNX_DIR = "data/models/onnx"   # Exported (and quantized) models are cached here
+ONNX_THREADS = 4                # Intra-op threads per ONNX session
+ONNX_QUANTIZE = True            # Dynamic int8 weight quantization
+
+# Corpus embedding (02_embed_chunks.py)
+EMBED_WORKERS = 1               # Encoder processes (1 = encode in-process)
+EMBED_THREADS_PER_WORKER = 0    # Intra-op threads per worker (0 = cores // workers)
+
+# Cascaded re-ranking: score top_k candidates first, more only if ambiguous
+RERANK_CASCADE = True
+CASCADE_STEP = 10          # Candidates added per extra round
+CASCADE_MARGIN = 3.0       # Stop if top-1 beats top-2 by this many rerank logits
+CASCADE_AGREEMENT = 0.8    # Stop if this share of the rerank top half is the hybrid top half
+
+# Micro-batching of encode / rerank calls across concurrent requests
+USE_MICROBATCHING = True
+MICROBATCH_MAX_WAIT_MS = 5      # How long to wait for more requests to join a batch
+MICROBATCH_MAX_BATCH = 128      # Items (texts or pairs) that close a batch early
 
 # Retrieval
 DEFAULT_TOP_K = 10
 SEMANTIC_WEIGHT = 0.7
 KEYWORD_WEIGHT = 0.3
+PIPELINED_SEARCH = True          # Search the original query while expansion runs
+EXPANSION_BUDGET_SECONDS = 2.0   # Max wait for expansion before using original only
+EXPANSION_WORKERS = 16           # Concurrent expansions per API worker (≥ its request threads);
+                                 # when all are busy, new requests skip expansion
+
+# Keyword search (BM25)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Vector index backend for semantic search
+# "exact" = brute-force float32 scan
+# "ivf"   = k-means inverted file (approximate)
+# "int8"  = scan int8-quantized vectors, re-score the best with float32
+# "pq"    = product-quantized codes (smallest), optional float32 re-rank
+VECTOR_INDEX = "exact"
+IVF_NLIST = 0       # Number of clusters (0 = ~4·√n)
+IVF_NPROBE = 8      # Clusters scanned per query (higher = better recall, slower)
+INT8_RESCORE_CANDIDATES = 300   # Top int8 hits re-scored at full precision
+PQ_SUBSPACES = 48               # Bytes per vector (must divide the embedding dim)
+PQ_RERANK_CANDIDATES = 200      # Top PQ hits re-scored at full precision (0 = off)
 
 # Paths
 EMBEDDINGS_PATH = "data/vectorstore/embeddings.npy"
-CHUNKS_PATH = "data/vectorstore/chunks.pkl"
+CHUNK_STORE_DIR = "data/vectorstore/chunks"
+CHUNKS_PATH = "data/vectorstore/chunks.pkl"  # Legacy format, converted on load
+KEYWORD_INDEX_DIR = "data/vectorstore/bm25"
+VECTORSTORE_META_PATH = "data/vectorstore/meta.json"
+MANIFEST_PATH = "data/vectorstore/manifest.json"   # File + chunk hashes for incremental rebuilds
+IVF_INDEX_PATH = "data/vectorstore/ivf_index.npz"
+INT8_EMBEDDINGS_PATH = "data/vectorstore/embeddings_int8.npy"
+INT8_SCALE_PATH = "data/vectorstore/embeddings_int8_scale.npy"
+PQ_INDEX_PATH = "data/vectorstore/pq_index.npz"
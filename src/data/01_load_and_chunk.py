@@ -1,65 +1,60 @@
 """
 Phase 1: Load PDFs and chunk text for RAG
-Extracts text from Harry Potter PDFs, splits into chunks with overlap
+Extracts text from every PDF in data/raw, splits into chunks with overlap
+
+PARALLEL EXTRACTION:
+- Every PDF is cut into shards of PAGES_PER_SHARD pages
+- A process pool extracts the shards on all cores at once
+  (PyMuPDF is CPU-bound and holds the GIL, so threads wouldn't help),
+  with only workers × SHARDS_PER_WORKER shards in flight at a time
+- Each worker opens its own copy of the PDF — open documents
+  can't be sent between processes
+- Shards are consumed in page order and streamed, page by page,
+  into the chunker — no document is ever joined into one string
+- Every chunk records the page it starts on
+
+INCREMENTAL: PDFs whose SHA-256 matches the manifest of the previous
+run (and that were chunked with the same settings) are not extracted
+again — their chunks are copied from the previous output. That output
+is read, not the vector store: the vector store has near-duplicates
+collapsed (see 02_embed_chunks.py), so it no longer holds every chunk
+of every file. PDFs no longer in data/raw are dropped. --full
+re-extracts all.
+
+The new chunks are written next to the old ones (chunks.partial) and
+swapped in at the end, so the previous output stays readable while
+it's being reused and a failed run leaves it untouched.
+
+Run from the project root:
+    python3 src/data/01_load_and_chunk.py [--workers N] [--full]
 """
+import argparse
+import itertools
 import os
-import pickle
+import shutil
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import numpy as np
 
 # pip install pymupdf
 import fitz  # PyMuPDF
 
-print("=" * 60)
-print("PHASE 1: LOAD AND CHUNK DOCUMENTS")
-print("=" * 60)
-
-# ============================================================
-# EXTRACT TEXT FROM PDFs
-# ============================================================
-print("\n" + "=" * 60)
-print("EXTRACTING TEXT FROM PDFs")
-print("=" * 60)
-
-raw_dir = Path("data/raw")
-documents = []
-
-# Start with the main collection
-target_files = [
-    "Harry Potter: The Complete Collection (1-7).pdf"
-]
-
-for filename in target_files:
-    filepath = raw_dir / filename
-    print(f"\nProcessing: {filename}")
-    print(f"  Size: {filepath.stat().st_size / 1024 / 1024:.1f} MB")
-
-    doc = fitz.open(str(filepath))
-    print(f"  Pages: {len(doc)}")
-
-    full_text = ""
-    for page_num, page in enumerate(doc):
-        text = page.get_text()
-        if text.strip():
-            full_text += text + "\n"
-
-        if (page_num + 1) % 100 == 0:
-            print(f"  Extracted {page_num + 1}/{len(doc)} pages...")
-
-    documents.append({
-        "source": filename,
-        "text": full_text,
-        "pages": len(doc)
-    })
-    doc.close()
-
-    print(f"  ✓ Extracted {len(full_text):,} characters")
-
-# ============================================================
-# CHUNK TEXT
-# ============================================================
-print("\n" + "=" * 60)
-print("CHUNKING TEXT")
-print("=" * 60)
+# Add project root to path so we can import src modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.chunk_store import ChunkStore, write_chunk_store
+from src.chunker import chunk_pages
+from src.config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, EMBEDDING_MODEL
+from src.inference import load_tokenizer
+from src.manifest import file_hash, load_manifest, save_manifest
+from src.vectorstore import replace_directory
+
+RAW_DIR = Path("data/raw")
+OUTPUT_DIR = Path("data/processed/chunks")
+STAGING_DIR = Path("data/processed/chunks.partial")
+PAGES_PER_SHARD = 50   # Pages extracted per task
+SHARDS_PER_WORKER = 2  # Shards in flight per process (bounds memory)
 
 """
 WHY CHUNK?
@@ -68,9 +63,11 @@ WHY CHUNK?
 - Retrieval is more precise with smaller chunks
 
 CHUNK SIZE TRADE-OFF:
-- Too small (100 chars): Loses context, fragments sentences
-- Too big (5000 chars): Too vague for precise retrieval
-- Sweet spot: 500-1000 chars with overlap
+- Too small: Loses context, fragments sentences
+- Too big: Too vague for precise retrieval — and anything past
+  MiniLM's 256-token window is silently cut off before embedding
+- So chunks are sized in the model's own tokens (CHUNK_MAX_TOKENS)
+  and always end on a sentence boundary (see src/chunker.py)
 
 OVERLAP:
 - Without overlap: Information at chunk boundaries gets lost
@@ -78,82 +75,194 @@ OVERLAP:
 - Ensures no context falls through the cracks
 """
 
-CHUNK_SIZE = 800       # Characters per chunk
-CHUNK_OVERLAP = 200    # Overlap between consecutive chunks
+# Chunks from a different chunker/settings are never mixed into one store
+CHUNKER = f"sentences:{EMBEDDING_MODEL}:{CHUNK_MAX_TOKENS}:{CHUNK_OVERLAP_TOKENS}"
 
-def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    """
-    Split text into overlapping chunks
-
-    Example with chunk_size=10, overlap=3:
-    Text: "The wizard cast a powerful spell on the dragon"
-    Chunk 1: "The wizard"
-    Chunk 2: "ard cast a"    (overlaps "ard" from chunk 1)
-    Chunk 3: "t a powerf"   (overlaps "t a" from chunk 2)
-    """
-    chunks = []
-    start = 0
-
-    while start < len(text):
-        end = start + chunk_size
 
-        # Try to break at a sentence boundary
-        chunk = text[start:end]
-
-        # Look for last period, question mark, or newline near the end
-        for sep in ['. ', '? ', '! ', '\n']:
-            last_sep = chunk.rfind(sep)
-            if last_sep > chunk_size * 0.5:  # Only if it's past halfway
-                chunk = chunk[:last_sep + 1]
-                end = start + last_sep + 1
-                break
-
-        if chunk.strip():
-            chunks.append({
-                "text": chunk.strip(),
-                "start_char": start,
-                "chunk_id": len(chunks)
-            })
-
-        start = end - overlap
+# ============================================================
+# EXTRACT TEXT FROM PDFs
+# ============================================================
 
-    return chunks
+def page_count(filepath):
+    with fitz.open(str(filepath)) as doc:
+        return len(doc)
 
 
-all_chunks = []
+def extract_pages(filepath, first, last):
+    """
+    Worker: text of pages [first, last) of one PDF
 
-for doc in documents:
-    print(f"\nChunking: {doc['source']}")
-    chunks = chunk_text(doc['text'])
+    Returns [(page_number, text), ...] with 1-based page numbers,
+    skipping pages that have no text.
+    """
+    pages = []
+    with fitz.open(str(filepath)) as doc:
+        for page_num in range(first, last):
+            text = doc[page_num].get_text()
+            if text.strip():
+                pages.append((page_num + 1, text))
+    return pages
+
+
+def plan_shards(filepaths, pages_per_shard=PAGES_PER_SHARD):
+    """(filepath, first, last) for every page range of every PDF, in page order"""
+    shards = []
+    for filepath in filepaths:
+        count = page_count(filepath)
+        print(f"\n{filepath.name}")
+        print(f"  Size: {filepath.stat().st_size / 1024 / 1024:.1f} MB")
+        print(f"  Pages: {count}")
+        shards.extend(
+            (filepath, first, min(first + pages_per_shard, count))
+            for first in range(0, count, pages_per_shard)
+        )
+    return shards
+
+
+def extract_shards(pool, shards, window):
+    """
+    Extract shards on the pool, yielding (filepath, pages) in the order given
 
-    for chunk in chunks:
-        chunk['source'] = doc['source']
+    At most `window` shards are in flight (queued, running, or done
+    but not yet consumed); the next one is submitted as each result
+    is taken. Peak memory is a few shards of text, not the corpus.
+    """
+    in_flight = deque()
+    for filepath, first, last in shards:
+        in_flight.append((filepath, pool.submit(extract_pages, filepath, first, last)))
+        if len(in_flight) >= window:
+            filepath, future = in_flight.popleft()
+            yield filepath, future.result()
+    while in_flight:
+        filepath, future = in_flight.popleft()
+        yield filepath, future.result()
 
-    all_chunks.extend(chunks)
-    print(f"  ✓ Created {len(chunks)} chunks")
 
-print(f"\n{'=' * 60}")
-print(f"TOTAL CHUNKS: {len(all_chunks)}")
-print(f"{'=' * 60}")
+def iter_pages(results):
+    """Yield (page_number, text) in order from one document's shard results"""
+    for _, pages in results:
+        yield from pages
 
-# Show sample chunks
-print("\n--- Sample Chunks ---")
-for i in [0, len(all_chunks) // 2, len(all_chunks) - 1]:
-    print(f"\nChunk {i}:")
-    print(f"  Source: {all_chunks[i]['source']}")
-    print(f"  Length: {len(all_chunks[i]['text'])} chars")
-    print(f"  Preview: {all_chunks[i]['text'][:150]}...")
 
 # ============================================================
-# SAVE CHUNKS
+# CHUNK TEXT
 # ============================================================
-print("\n" + "=" * 60)
-print("SAVING CHUNKS")
-print("=" * 60)
-
-output_path = Path("data/processed/chunks.pkl")
-with open(output_path, 'wb') as f:
-    pickle.dump(all_chunks, f)
 
-print(f"✓ Saved {len(all_chunks)} chunks to {output_path}")
-print(f"✓ Phase 1 complete!")
+def chunk_document(pages, source, tokenizer):
+    """Stream one document's pages through the chunker, tagging the source"""
+    for chunk in chunk_pages(pages, tokenizer):
+        chunk["source"] = source
+        yield chunk
+
+
+def reuse_chunks(store, source):
+    """Chunk dicts of one source, copied from the previous run's output"""
+    code = store.sources.index(source)
+    return store.take(np.flatnonzero(np.asarray(store.source_codes) == code))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract and chunk every PDF in data/raw")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Extraction processes (default: all cores)")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-extract every PDF, ignoring the manifest")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("PHASE 1: LOAD AND CHUNK DOCUMENTS")
+    print("=" * 60)
+
+    filepaths = sorted(RAW_DIR.glob("*.pdf"))
+    if not filepaths:
+        print(f"No PDFs found in {RAW_DIR}")
+        return
+
+    # Only PDFs that are new or changed since the last build get extracted
+    file_hashes = {filepath.name: file_hash(filepath) for filepath in filepaths}
+    manifest = load_manifest(OUTPUT_DIR / "manifest.json")
+    previous = manifest.get("files", {})
+    if args.full or manifest.get("chunker") != CHUNKER:
+        previous = {}
+    store = ChunkStore(OUTPUT_DIR) if ChunkStore.exists(OUTPUT_DIR) else None
+    unchanged = {
+        name for name, digest in file_hashes.items()
+        if store is not None and previous.get(name) == digest and name in store.sources
+    }
+    removed = sorted(set(manifest.get("files", {})) - set(file_hashes))
+    to_extract = [filepath for filepath in filepaths if filepath.name not in unchanged]
+    print(f"\n{len(unchanged)} unchanged, {len(to_extract)} new or changed, "
+          f"{len(removed)} removed")
+    for name in removed:
+        print(f"  - dropping {name}")
+
+    print("\n" + "=" * 60)
+    print("EXTRACTING AND CHUNKING")
+    print("=" * 60)
+
+    tokenizer = load_tokenizer()
+    counts = {}
+
+    workers = args.workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        shards = plan_shards(to_extract)
+        print(f"\nExtracting in {len(shards)} shards ({workers} processes)...")
+        # Shard results grouped per document, in to_extract order
+        documents = itertools.groupby(
+            extract_shards(pool, shards, workers * SHARDS_PER_WORKER),
+            key=lambda result: result[0]
+        )
+        has_pages = {filepath for filepath, _, _ in shards}
+
+        def all_chunks():
+            """Every chunk in file order; new documents are streamed, not held"""
+            for filepath in filepaths:
+                if filepath.name in unchanged:
+                    chunks = reuse_chunks(store, filepath.name)
+                    label = "Reused"
+                else:
+                    pages = iter_pages(next(documents)[1]) if filepath in has_pages else []
+                    chunks = chunk_document(pages, filepath.name, tokenizer)
+                    label = "Chunked"
+                counts[filepath.name] = 0
+                for chunk in chunks:
+                    counts[filepath.name] += 1
+                    yield chunk
+                print(f"  ✓ {label} {filepath.name}: {counts[filepath.name]} chunks")
+
+        shutil.rmtree(STAGING_DIR, ignore_errors=True)
+        write_chunk_store(STAGING_DIR, all_chunks())
+
+    # 02_embed_chunks.py copies these into the vector store manifest
+    save_manifest({"files": file_hashes, "chunker": CHUNKER}, STAGING_DIR / "manifest.json")
+    store = None
+    replace_directory(STAGING_DIR, OUTPUT_DIR)
+
+    total = sum(counts.values())
+    print(f"\n{'=' * 60}")
+    print(f"TOTAL CHUNKS: {total}")
+    print(f"{'=' * 60}")
+
+    if not total:
+        print("No text extracted")
+        return
+
+    # Show sample chunks
+    saved = ChunkStore(OUTPUT_DIR)
+    lengths = [len(tokenizer(saved.text(i))["input_ids"]) for i in range(min(total, 2000))]
+    print(f"\nTokens per chunk (first {len(lengths)}, incl. [CLS]/[SEP]): "
+          f"median {int(np.median(lengths))}, max {max(lengths)}")
+    print("\n--- Sample Chunks ---")
+    for i in [0, total // 2, total - 1]:
+        chunk = saved[i]
+        print(f"\nChunk {i}:")
+        print(f"  Source: {chunk['source']} (page {chunk.get('page', 0)})")
+        print(f"  Length: {len(chunk['text'])} chars")
+        print(f"  Preview: {chunk['text'][:150]}...")
+
+    print(f"\n✓ Saved {total} chunks to {OUTPUT_DIR}")
+    print(f"✓ Phase 1 complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,32 +8,51 @@ HOW EMBEDDINGS WORK:
 - "Harry cast a spell" and "Potter used magic" → close together
 - "Harry cast a spell" and "Dumbledore ate dinner" → far apart
 - This lets us search by MEANING, not just keyword matching
+
+DEDUP: before anything is embedded, near-duplicate chunks (the same
+passage quoted in several books) are collapsed into one — see
+src/dedup.py. The kept chunk lists every place it also appears in.
+
+Run from the project root:
+    python3 src/data/02_embed_chunks.py [--workers N] [--threads-per-worker T] [--no-dedup]
 """
-import pickle
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from collections import Counter
 import numpy as np
+from numpy.lib.format import open_memmap
 from pathlib import Path
 
-# pip install sentence-transformers
-from sentence_transformers import SentenceTransformer
+# Add project root to path so we can import src modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.vectorstore import (
+    normalize_rows, commit_embeddings, save_int8_embeddings, replace_directory, load_meta
+)
+from src.chunk_store import ChunkStore, write_chunk_store
+from src.keyword_index import KeywordIndex
+from src.vector_index import load_vector_index
+from src.inference import load_embedder, token_lengths, length_bucketed_batches, EncoderPool
+from src.manifest import chunk_hash, rows_hash, load_manifest, save_manifest
+from src.dedup import deduplicate
+from src.config import (
+    EMBEDDING_MODEL, INFERENCE_BACKEND, EMBED_WORKERS, EMBED_THREADS_PER_WORKER, VECTOR_INDEX,
+    DEDUP, DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_SHINGLE_WORDS
+)
 
-print("=" * 60)
-print("PHASE 2: EMBED CHUNKS")
-print("=" * 60)
+INPUT_DIR = Path("data/processed/chunks")
+OUTPUT_DIR = Path("data/vectorstore")
+TOKENS_PER_BATCH = 256 * 128   # Padded tokens per model call
+MAX_BATCH_SIZE = 1024          # Cap for batches of very short chunks
+COPY_BLOCK = 65536             # Reused rows copied per step
 
-# ============================================================
-# LOAD CHUNKS
-# ============================================================
-print("\nLoading chunks...")
-with open("data/processed/chunks.pkl", "rb") as f:
-    chunks = pickle.load(f)
-print(f"✓ Loaded {len(chunks)} chunks")
 
 # ============================================================
 # LOAD EMBEDDING MODEL
 # ============================================================
-print("\n" + "=" * 60)
-print("LOADING EMBEDDING MODEL")
-print("=" * 60)
 
 """
 MODEL: all-MiniLM-L6-v2
@@ -47,80 +66,348 @@ WHY THIS MODEL:
   but slower and heavier
 - For our use case, MiniLM is the sweet spot
 - Same model used in most RAG tutorials and production systems
+
+INFERENCE_BACKEND = "onnx" runs the same model through ONNX Runtime
+(int8-quantized by default) — faster on CPU, near-identical vectors.
 """
-print("\nLoading sentence-transformers model...")
-print("(Downloads ~80MB on first run)")
-model = SentenceTransformer('all-MiniLM-L6-v2')
-print("✓ Model loaded")
-
-# Quick demo of what embeddings look like
-demo_sentences = [
-    "Harry Potter cast a spell",
-    "Potter used his wand for magic",
-    "Dumbledore enjoyed lemon drops"
-]
-demo_embeddings = model.encode(demo_sentences)
-
-print("\n--- Embedding Demo ---")
-print(f"Sentence: '{demo_sentences[0]}'")
-print(f"Vector shape: {demo_embeddings[0].shape}")
-print(f"First 10 values: {demo_embeddings[0][:10].round(4)}")
-
-# Show similarity
-from numpy.linalg import norm
+
+
 def cosine_similarity(a, b):
-    return np.dot(a, b) / (norm(a) * norm(b))
+    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+
+
+def load_model():
+    """Load the embedding model and show a quick demo; returns (model, dim)"""
+    print(f"\nLoading {EMBEDDING_MODEL} ({INFERENCE_BACKEND})...")
+    print("(Downloads ~80MB on first run)")
+    model = load_embedder()
+    print("✓ Model loaded")
+
+    # Quick demo of what embeddings look like
+    demo_sentences = [
+        "Harry Potter cast a spell",
+        "Potter used his wand for magic",
+        "Dumbledore enjoyed lemon drops"
+    ]
+    demo_embeddings = model.encode(demo_sentences)
+
+    print("\n--- Embedding Demo ---")
+    print(f"Sentence: '{demo_sentences[0]}'")
+    print(f"Vector shape: {demo_embeddings[0].shape}")
+    print(f"First 10 values: {demo_embeddings[0][:10].round(4)}")
+
+    sim_related = cosine_similarity(demo_embeddings[0], demo_embeddings[1])
+    sim_unrelated = cosine_similarity(demo_embeddings[0], demo_embeddings[2])
+    print(f"\nSimilarity ('cast a spell' vs 'used magic'): {sim_related:.4f}  ← RELATED")
+    print(f"Similarity ('cast a spell' vs 'lemon drops'): {sim_unrelated:.4f}  ← UNRELATED")
+    return model, demo_embeddings.shape[1]
 
-sim_related = cosine_similarity(demo_embeddings[0], demo_embeddings[1])
-sim_unrelated = cosine_similarity(demo_embeddings[0], demo_embeddings[2])
-print(f"\nSimilarity ('cast a spell' vs 'used magic'): {sim_related:.4f}  ← RELATED")
-print(f"Similarity ('cast a spell' vs 'lemon drops'): {sim_unrelated:.4f}  ← UNRELATED")
 
 # ============================================================
-# EMBED ALL CHUNKS
+# EMBED NEW AND CHANGED CHUNKS
 # ============================================================
-print("\n" + "=" * 60)
-print("EMBEDDING ALL CHUNKS")
-print("=" * 60)
 
-texts = [chunk['text'] for chunk in chunks]
+"""
+INCREMENTAL: data/vectorstore/manifest.json holds a hash of every
+chunk's text, one per embedding row. A chunk whose hash is already
+there (same model and backend) keeps its row — only new or changed
+chunks go through the model. Rows of chunks that disappeared are
+simply not copied, so the new matrix is compact and row i is
+always chunk i of the new chunk store.
+meta.json records a hash of the row list the matrix holds, and
+rows are only reused when it matches the manifest's chunks.
+
+STREAMING + RESUMABLE:
+- The final matrix is preallocated on disk (embeddings.partial.npy)
+  and each batch is written straight into its rows — nothing piles
+  up in memory and nothing is stacked at the end
+- After every batch the file is flushed and a checkpoint records
+  how many chunks are done; a run that was interrupted picks up
+  from the last completed batch
+- Batches are sized by tokens, not by count: a batch costs
+  (number of texts × longest text), so short chunks go in big
+  batches and long chunks in small ones
+
+LENGTH BUCKETING: chunks run from short page-break fragments to
+full 800-character passages. In corpus order every batch is padded
+to its longest member, so short chunks pay for tokens they don't
+have. Sorting by token length first keeps each batch nearly
+uniform; each batch's vectors are written back at its chunks' own
+rows, so the output is still in chunk order.
+
+MULTI-PROCESS: with --workers N, batches are encoded by N worker
+processes (see EncoderPool), each with its own model and a capped
+thread count. Results come back in submission order, so the
+checkpoint still means "everything before this point is done".
+"""
+
+
+def encode_batches(model, jobs, workers, threads_per_worker):
+    """(rows, texts) jobs → (rows, vectors), in-process or across workers"""
+    if workers <= 1:
+        for rows, batch_texts in jobs:
+            yield rows, model.encode(batch_texts, batch_size=len(batch_texts),
+                                     show_progress_bar=False)
+        return
+
+    with EncoderPool(workers, threads_per_worker or None) as pool:
+        print(f"Started {workers} encoder processes × {pool.threads_per_worker} threads")
+        yield from pool.imap(jobs)
+
+
+def embed_chunks(model, dim, texts, hashes, manifest, same_model, workers, threads_per_worker):
+    """Write every chunk's unit vector into the staged matrix; returns (matrix, checkpoint) paths"""
+    staged_path = OUTPUT_DIR / "embeddings.partial.npy"
+    checkpoint_path = OUTPUT_DIR / "embeddings.partial.json"
+
+    # Old rows are only reused when embeddings.npy provably holds the
+    # manifest's chunks: an interrupted run can leave a new matrix next
+    # to the old manifest, and its rows would be paired with wrong hashes
+    old_rows = {}
+    old_embeddings = None
+    old_hashes = manifest.get("chunks", [])
+    if (same_model and (OUTPUT_DIR / "embeddings.npy").exists()
+            and load_meta(OUTPUT_DIR / "meta.json").get("rows") == rows_hash(old_hashes)):
+        old_embeddings = np.load(OUTPUT_DIR / "embeddings.npy", mmap_mode="r")
+        if len(old_embeddings) == len(old_hashes):
+            old_rows = {digest: row for row, digest in enumerate(old_hashes)}
+
+    reused = [i for i, digest in enumerate(hashes) if digest in old_rows]
+    missing = [i for i, digest in enumerate(hashes) if digest not in old_rows]
+    print(f"\n{len(reused)} chunks unchanged (embeddings reused), {len(missing)} to embed")
+
+    # Identifies this exact job — a checkpoint from any other one is ignored
+    job = chunk_hash(json.dumps(
+        [EMBEDDING_MODEL, INFERENCE_BACKEND, manifest.get("store_version", 0), hashes,
+         "length-bucketed", TOKENS_PER_BATCH, MAX_BATCH_SIZE]
+    ))
+    checkpoint = load_manifest(checkpoint_path)
 
-print(f"\nEmbedding {len(texts)} chunks...")
-print("This may take a few minutes on CPU...\n")
+    if checkpoint.get("job") == job and staged_path.exists():
+        staged = open_memmap(staged_path, mode="r+")
+        done = checkpoint["done"]
+        print(f"Resuming from checkpoint: {done}/{len(missing)} already embedded")
+    else:
+        staged = open_memmap(staged_path, mode="w+", dtype=np.float32, shape=(len(texts), dim))
+        # Old rows are already unit-norm
+        for i in range(0, len(reused), COPY_BLOCK):
+            rows = reused[i:i + COPY_BLOCK]
+            staged[rows] = old_embeddings[[old_rows[hashes[row]] for row in rows]]
+        staged.flush()
+        done = 0
+        save_manifest({"job": job, "done": done}, checkpoint_path)
+    old_embeddings = None
 
-# Encode in batches (shows progress)
-BATCH_SIZE = 256
-all_embeddings = []
+    if done < len(missing):
+        print("This may take a few minutes on CPU...\n")
+    lengths = token_lengths(model, [texts[row] for row in missing]) if missing else []
+    resume_from = done
 
-for i in range(0, len(texts), BATCH_SIZE):
-    batch = texts[i:i + BATCH_SIZE]
-    batch_embeddings = model.encode(batch, show_progress_bar=False)
-    all_embeddings.append(batch_embeddings)
+    def jobs():
+        position = 0
+        for batch in length_bucketed_batches(lengths, TOKENS_PER_BATCH, MAX_BATCH_SIZE):
+            position += len(batch)
+            if position > resume_from:   # Earlier batches finished before the restart
+                rows = [missing[i] for i in batch]
+                yield rows, [texts[row] for row in rows]
 
-    done = min(i + BATCH_SIZE, len(texts))
-    pct = done / len(texts) * 100
-    print(f"  Embedded {done}/{len(texts)} chunks ({pct:.0f}%)")
+    start_time = time.perf_counter()
+    last_report = 0.0
+    embedded_now = 0
+    for rows, vectors in encode_batches(model, jobs(), workers, threads_per_worker):
+        staged[rows] = normalize_rows(vectors)
+        staged.flush()
+        done += len(rows)
+        save_manifest({"job": job, "done": done}, checkpoint_path)
+
+        embedded_now += len(rows)
+        elapsed = time.perf_counter() - start_time
+        if elapsed - last_report >= 1.0 or done == len(missing):
+            last_report = elapsed
+            rate = embedded_now / elapsed
+            eta = (len(missing) - done) / rate
+            print(f"  Embedded {done}/{len(missing)} chunks  "
+                  f"({rate:.0f} chunks/sec, batch {len(rows)}, ETA {eta:.0f}s)")
+
+    staged.flush()
+    print(f"\n✓ All chunks embedded")
+    print(f"  Shape: {staged.shape}  ({staged.shape[0]} chunks × {staged.shape[1]} dimensions)")
+    return staged_path, checkpoint_path
 
-embeddings = np.vstack(all_embeddings)
-print(f"\n✓ All chunks embedded")
-print(f"  Shape: {embeddings.shape}  ({embeddings.shape[0]} chunks × {embeddings.shape[1]} dimensions)")
 
 # ============================================================
-# SAVE EMBEDDINGS
+# REMOVE NEAR-DUPLICATES
 # ============================================================
-print("\n" + "=" * 60)
-print("SAVING EMBEDDINGS")
-print("=" * 60)
 
-output_path = Path("data/vectorstore")
+def remove_duplicates(store):
+    """
+    Rows of the chunk store to embed, and the rows folded into each
+
+    Works on the store's columns: texts are streamed once to build
+    signatures, and sizes come from the text offsets.
+    """
+    print(f"\nFinding near-duplicates (MinHash, Jaccard ≥ {DEDUP_THRESHOLD})...")
+    start_time = time.perf_counter()
+    kept, merged, stats = deduplicate(store.texts(), np.diff(store.offsets))
+    print(f"✓ {stats['chunks_in']} → {stats['chunks_out']} chunks "
+          f"({stats['removed']} removed, {stats['reduction']:.1%} fewer to embed) "
+          f"in {time.perf_counter() - start_time:.1f}s")
+    print(f"  {stats['groups']} duplicate groups, largest has {stats['largest_group']} copies")
+    removed_by_source = Counter(store.source(row) for rows in merged.values() for row in rows)
+    for source, removed in removed_by_source.most_common():
+        print(f"  - {source}: {removed} duplicates folded into other chunks")
+    return kept, merged
+
+
+def folded_refs(store, rows):
+    """Ref dicts ({"source", "page", "doc_chunk"}) for rows folded into another chunk"""
+    page = store.columns.get("page")
+    doc_chunk = store.columns.get("chunk_id")
+    return [
+        {"source": store.source(row),
+         "page": int(page[row]) if page is not None else 0,
+         "doc_chunk": int(doc_chunk[row]) if doc_chunk is not None else 0}
+        for row in rows
+    ]
+
+
+def kept_chunks(store, kept, merged):
+    """Chunk dicts of the kept rows, with refs, built one at a time for writing"""
+    for row in kept:
+        chunk = store[row]
+        chunk["refs"] = folded_refs(store, merged.get(row, []))
+        yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed chunks into the vector store")
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS,
+                        help="Encoder processes (1 = encode in this process)")
+    parser.add_argument("--threads-per-worker", type=int, default=EMBED_THREADS_PER_WORKER,
+                        help="Intra-op threads per worker (0 = cores // workers)")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Embed every chunk, keeping near-duplicates")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("PHASE 2: EMBED CHUNKS")
+    print("=" * 60)
+
+    # ============================================================
+    # LOAD CHUNKS
+    # ============================================================
+    print("\nLoading chunks...")
+    store = ChunkStore(INPUT_DIR)
+    print(f"✓ Loaded {len(store)} chunks")
+
+    kept, merged = np.arange(len(store)), {}
+    dedup = None
+    if DEDUP and not args.no_dedup:
+        kept, merged = remove_duplicates(store)
+        dedup = f"minhash:{DEDUP_SHINGLE_WORDS}:{DEDUP_NUM_PERM}:{DEDUP_BANDS}:{DEDUP_THRESHOLD}"
+
+    texts = [store.text(row) for row in kept]
+    hashes = [chunk_hash(text) for text in texts]
+    pending = load_manifest(INPUT_DIR / "manifest.json")
+    file_hashes = pending.get("files", {})
+
+    manifest = load_manifest(OUTPUT_DIR / "manifest.json")
+    same_model = (manifest.get("model") == EMBEDDING_MODEL
+                  and manifest.get("inference_backend") == INFERENCE_BACKEND)
+    if (same_model and manifest.get("chunks") == hashes and manifest.get("files") == file_hashes
+            and manifest.get("chunker") == pending.get("chunker")
+            and manifest.get("dedup") == dedup):
+        print(f"\n✓ Vector store is up to date (store version {manifest['store_version']})")
+        return
+
+    print("\n" + "=" * 60)
+    print("LOADING EMBEDDING MODEL")
+    print("=" * 60)
+    model, dim = load_model()
+
+    print("\n" + "=" * 60)
+    print("EMBEDDING NEW AND CHANGED CHUNKS")
+    print("=" * 60)
+    staged_path, checkpoint_path = embed_chunks(
+        model, dim, texts, hashes, manifest, same_model,
+        args.workers, args.threads_per_worker
+    )
+
+    # Derived indexes (IVF, PQ) check this to know they must be rebuilt
+    store_version = manifest.get("store_version", 0) + 1
+
+    # ============================================================
+    # SAVE EMBEDDINGS
+    # ============================================================
+    print("\n" + "=" * 60)
+    print("SAVING EMBEDDINGS")
+    print("=" * 60)
+
+    # Chunks and keyword index are written next to the live ones first:
+    # API workers have the live files memory-mapped, so they are
+    # swapped in by rename below, never rewritten in place
+    staged_chunks = OUTPUT_DIR / "chunks.partial"
+    staged_bm25 = OUTPUT_DIR / "bm25.partial"
+    for staged_dir in [staged_chunks, staged_bm25]:
+        shutil.rmtree(staged_dir, ignore_errors=True)
+    # Columnar chunk store that API workers memory-map and share
+    # (with the refs of every collapsed duplicate)
+    write_chunk_store(staged_chunks, kept_chunks(store, kept, merged), store_version=store_version)
+    # Keyword index is built here once, not on every API start
+    keyword_index = KeywordIndex.build(texts)
+    keyword_index.save(staged_bm25, store_version=store_version)
+
+    # Rows were normalized as they were written, so search is a plain dot product
+    embeddings = commit_embeddings(
+        staged_path,
+        path=OUTPUT_DIR / "embeddings.npy",
+        meta_path=OUTPUT_DIR / "meta.json",
+        rows=rows_hash(hashes),
+        model=EMBEDDING_MODEL,
+        inference_backend=INFERENCE_BACKEND,
+        store_version=store_version
+    )
+    os.remove(checkpoint_path)
+    print(f"✓ Saved unit-norm float32 embeddings: {OUTPUT_DIR / 'embeddings.npy'}")
+
+    # Right after the embeddings, so rows and chunks are only out of
+    # step for two renames (Retriever refuses to start if they are)
+    replace_directory(staged_chunks, OUTPUT_DIR / "chunks")
+    print(f"✓ Saved chunks: {OUTPUT_DIR / 'chunks'}")
+    replace_directory(staged_bm25, OUTPUT_DIR / "bm25")
+    print(f"✓ Saved keyword index ({len(keyword_index.vocab)} terms): {OUTPUT_DIR / 'bm25'}")
+
+    # int8 copy for VECTOR_INDEX = "int8" (4× smaller to scan)
+    save_int8_embeddings(
+        embeddings,
+        path=OUTPUT_DIR / "embeddings_int8.npy",
+        scale_path=OUTPUT_DIR / "embeddings_int8_scale.npy",
+        meta_path=OUTPUT_DIR / "meta.json",
+        store_version=store_version
+    )
+    print(f"✓ Saved int8 embeddings: {OUTPUT_DIR / 'embeddings_int8.npy'}")
+
+    # IVF / PQ are trained here, once, instead of by every API worker
+    # on its first start after the rebuild
+    if VECTOR_INDEX in ("ivf", "pq"):
+        load_vector_index(embeddings)
+
+    # Written last: the manifest describes a store that is fully on disk
+    save_manifest({
+        "store_version": store_version,
+        "model": EMBEDDING_MODEL,
+        "inference_backend": INFERENCE_BACKEND,
+        "files": file_hashes,
+        "chunker": pending.get("chunker"),
+        "dedup": dedup,
+        "chunks": hashes
+    }, OUTPUT_DIR / "manifest.json")
+    print(f"✓ Saved manifest (store version {store_version}): {OUTPUT_DIR / 'manifest.json'}")
 
-np.save(output_path / "embeddings.npy", embeddings)
-print(f"✓ Saved embeddings: {output_path / 'embeddings.npy'}")
+    print(f"\n✓ Phase 2 complete!")
+    print(f"  {len(texts)} chunks embedded into {embeddings.shape[1]}-dimensional vectors")
+    print(f"  Ready for semantic search!")
 
-with open(output_path / "chunks.pkl", "wb") as f:
-    pickle.dump(chunks, f)
-print(f"✓ Saved chunks: {output_path / 'chunks.pkl'}")
 
-print(f"\n✓ Phase 2 complete!")
-print(f"  {len(chunks)} chunks embedded into {embeddings.shape[1]}-dimensional vectors")
-print(f"  Ready for semantic search!")
+if __name__ == "__main__":
+    main()
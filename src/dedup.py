@@ -0,0 +1,129 @@
+"""
+Near-Duplicate Detection
+Collapse chunks that say (almost) the same thing into one
+
+ANALOGY: The companion books quote the novels page after page, so
+the card catalogue ends up with five cards for the same paragraph.
+The librarian keeps one card per passage and writes on its back
+every other book and page it also appears in. Fewer cards to
+search, and the reader never gets five copies of one quote.
+
+HOW IT WORKS (MinHash + LSH):
+- Each chunk becomes the set of its 5-word shingles
+- MinHash: num_perm random hash functions; for each, keep the
+  smallest hash over the set. Two chunks agree on a position with
+  probability equal to their Jaccard similarity
+- LSH: the signature is cut into bands; chunks that match on every
+  value of any one band land in the same bucket. Each member of a
+  bucket is compared only with the bucket's first member, so the
+  cost is linear in the number of chunks
+- Two chunks are duplicates if their signatures agree on at least
+  `threshold` of the positions (estimated Jaccard)
+- Duplicates are grouped (union-find); the longest chunk of a group
+  is kept and records where the others came from (source, page and
+  doc_chunk — the chunk's number within its own document)
+"""
+import re
+import zlib
+from collections import defaultdict
+import numpy as np
+from src.config import (
+    DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_SHINGLE_WORDS
+)
+
+WORD = re.compile(r"\w+")
+
+
+def shingles(text, k=DEDUP_SHINGLE_WORDS):
+    """CRC32 of every k-word window (the whole text if it's shorter)"""
+    words = WORD.findall(text.lower())
+    windows = [" ".join(words[i:i + k]) for i in range(max(len(words) - k + 1, 1))]
+    return np.array([zlib.crc32(w.encode("utf-8")) for w in windows], dtype=np.uint64)
+
+
+def _mix(x):
+    """splitmix64 finalizer: scrambles every bit of x into every bit of the result"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def minhash_signatures(texts, num_perm=DEDUP_NUM_PERM, seed=0):
+    """(n × num_perm) uint32 MinHash signatures of an iterable of n texts"""
+    # One random salt per hash function; mixing (shingle ^ salt) gives
+    # num_perm independent-looking orderings of the shingles
+    salts = np.random.default_rng(seed).integers(0, 1 << 63, num_perm, dtype=np.uint64)
+    signatures = []
+    with np.errstate(over="ignore"):   # multiplication mod 2^64 is intended
+        for text in texts:
+            hashed = _mix(shingles(text)[:, None] ^ salts)
+            signatures.append((hashed.min(axis=0) >> np.uint64(32)).astype(np.uint32))
+    return np.array(signatures, dtype=np.uint32).reshape(-1, num_perm)
+
+
+def duplicate_groups(texts, threshold=DEDUP_THRESHOLD, num_perm=DEDUP_NUM_PERM,
+                     bands=DEDUP_BANDS):
+    """Lists of row ids (≥ 2 each) whose texts are near-duplicates"""
+    signatures = minhash_signatures(texts, num_perm)
+    rows = num_perm // bands
+    parent = list(range(len(signatures)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets = defaultdict(list)
+        for i, key in enumerate(signatures[:, band * rows:(band + 1) * rows]):
+            buckets[key.tobytes()].append(i)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            # Each member is only compared with the bucket's first one,
+            # so a bucket of b identical chunks costs b checks, not b²
+            head, others = members[0], np.array(members[1:])
+            similar = np.mean(signatures[others] == signatures[head], axis=1) >= threshold
+            for i in others[similar]:
+                parent[find(int(i))] = find(head)
+
+    groups = defaultdict(list)
+    for i in range(len(signatures)):
+        groups[find(i)].append(i)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def deduplicate(texts, lengths, threshold=DEDUP_THRESHOLD):
+    """
+    Find which chunks to keep and which to fold into them
+
+    texts is any iterable of chunk texts (e.g. ChunkStore.texts(),
+    so no chunk dicts are built); lengths[i] is the size of text i.
+
+    Returns (kept, merged, stats): kept is the ascending array of row
+    ids to keep, merged maps a kept row to the rows folded into it,
+    and stats counts what was removed.
+    """
+    groups = duplicate_groups(texts, threshold)
+    dropped = []
+    merged = {}
+    for members in groups:
+        keep = max(members, key=lambda i: (lengths[i], -i))
+        merged[keep] = [i for i in members if i != keep]
+        dropped.extend(merged[keep])
+
+    keep_mask = np.ones(len(lengths), dtype=bool)
+    keep_mask[dropped] = False
+    kept = np.flatnonzero(keep_mask)
+    stats = {
+        "chunks_in": len(lengths),
+        "chunks_out": len(kept),
+        "groups": len(groups),
+        "removed": len(dropped),
+        "reduction": len(dropped) / len(lengths) if len(lengths) else 0.0,
+        "largest_group": max((len(g) for g in groups), default=0)
+    }
+    return kept, merged, stats
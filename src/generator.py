@@ -6,8 +6,7 @@ ANALOGY: This is the reader. You hand them the index cards
 (retrieved chunks) and your question. They read the cards
 and write an answer using ONLY what's on those cards.
 """
-import requests
-from src.config import ANTHROPIC_API_KEY, ANTHROPIC_MODEL
+from src.llm_client import get_client
 
 
 def generate_answer(query, context_chunks):
@@ -22,24 +21,15 @@ def generate_answer(query, context_chunks):
         for i, chunk in enumerate(context_chunks)
     ])
 
-    response = requests.post(
-        "https://api.anthropic.com/v1/messages",
-        headers={
-            "x-api-key": ANTHROPIC_API_KEY,
-            "anthropic-version": "2023-06-01",
-            "Content-Type": "application/json"
-        },
-        json={
-            "model": ANTHROPIC_MODEL,
-            "max_tokens": 1024,
-            "system": """You are a Harry Potter expert assistant.
+    data = get_client().messages(
+        system="""You are a Harry Potter expert assistant.
 Answer questions ONLY using the provided context passages.
 If the answer is not in the context, say "I couldn't find that in the provided passages."
 Be specific and cite which part of the text supports your answer.""",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"""Context passages from Harry Potter:
+        messages=[
+            {
+                "role": "user",
+                "content": f"""Context passages from Harry Potter:
 
 {context}
 
@@ -48,12 +38,13 @@ Be specific and cite which part of the text supports your answer.""",
 Question: {query}
 
 Answer based ONLY on the passages above."""
-                }
-            ]
-        }
+            }
+        ],
+        max_tokens=1024,
+        # Generation is the expensive call: never send it twice
+        retry_read_timeouts=False
     )
 
-    data = response.json()
     if "content" not in data:
         return f"API Error: {data.get('error', {}).get('message', 'Unknown error')}"
 
@@ -0,0 +1,316 @@
+"""
+Inference Backends
+Loads the embedding model and the re-ranker on PyTorch or ONNX Runtime
+
+ANALOGY: Same librarians, different training. The PyTorch versions
+read every card with full attention to detail. The ONNX versions
+were drilled on a fixed routine (exported graph) and taught to
+jot numbers down in shorthand (int8 weights) — they work faster on
+a plain CPU and give nearly the same answers.
+
+INFERENCE_BACKEND in src/config.py picks one:
+- "torch": SentenceTransformer / CrossEncoder, as before
+- "onnx":  models exported to ONNX once (cached under ONNX_DIR),
+           optionally int8 dynamically quantized, run by onnxruntime
+           with ONNX_THREADS intra-op threads
+
+Both expose the same encode() / predict() calls the rest of the
+code already uses, so Retriever and 02_embed_chunks.py don't care.
+"""
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from src.config import (
+    EMBEDDING_MODEL, RERANKER_MODEL, INFERENCE_BACKEND,
+    ONNX_DIR, ONNX_THREADS, ONNX_QUANTIZE
+)
+
+EMBEDDING_MAX_TOKENS = 256   # all-MiniLM-L6-v2 truncates here too
+RERANKER_MAX_TOKENS = 512
+
+
+def load_embedder(backend=INFERENCE_BACKEND):
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(EMBEDDING_MODEL)
+    if backend == "onnx":
+        return OnnxEmbedder(EMBEDDING_MODEL)
+    raise ValueError(f"Unknown INFERENCE_BACKEND: {backend!r}")
+
+
+def load_reranker(backend=INFERENCE_BACKEND):
+    if backend == "torch":
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(RERANKER_MODEL)
+    if backend == "onnx":
+        return OnnxCrossEncoder(RERANKER_MODEL)
+    raise ValueError(f"Unknown INFERENCE_BACKEND: {backend!r}")
+
+
+def load_tokenizer(model_name=EMBEDDING_MODEL):
+    """Just the embedding model's tokenizer (for chunking — no weights loaded)"""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(_hub_name(model_name))
+
+
+def token_lengths(model, texts, max_tokens=EMBEDDING_MAX_TOKENS):
+    """Tokens per text after truncation — what the model actually reads"""
+    encoded = model.tokenizer(list(texts), truncation=True, max_length=max_tokens)
+    return np.array([len(ids) for ids in encoded["input_ids"]], dtype=np.int64)
+
+
+def token_budget_batches(lengths, token_budget, max_batch):
+    """
+    Cut consecutive items into batches of at most token_budget padded tokens
+
+    A batch is padded to its longest text, so its cost is
+    len(batch) × longest. Short texts get big batches, long texts
+    small ones, and memory per batch stays about the same.
+    Yields (start, end) ranges; every batch has at least one item.
+    """
+    start = 0
+    while start < len(lengths):
+        end = start + 1
+        longest = lengths[start]
+        while end < len(lengths) and end - start < max_batch:
+            longest_with_next = max(longest, lengths[end])
+            if (end - start + 1) * longest_with_next > token_budget:
+                break
+            longest = longest_with_next
+            end += 1
+        yield start, end
+        start = end
+
+
+def length_bucketed_batches(lengths, token_budget, max_batch):
+    """
+    Group texts of similar token length, then cut by token budget
+
+    Sorting by length first means every batch holds texts of nearly
+    the same size, so almost nothing is padding. Yields arrays of
+    indices into the original list (deterministic for the same
+    lengths); write each batch's output back at those indices to
+    restore the original order.
+    """
+    order = np.argsort(np.asarray(lengths), kind="stable")
+    for start, end in token_budget_batches(np.asarray(lengths)[order], token_budget, max_batch):
+        yield order[start:end]
+
+
+def _hub_name(model_name):
+    """'all-MiniLM-L6-v2' → 'sentence-transformers/all-MiniLM-L6-v2'"""
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+def _export(model_name, kind, quantize=ONNX_QUANTIZE):
+    """
+    Export a Hugging Face model to ONNX once and return the file path
+
+    kind is "embedder" (token embeddings, pooled later) or "reranker"
+    (one relevance logit per pair). With quantize, the weights are
+    converted to int8 with onnxruntime's dynamic quantization.
+    """
+    out_dir = os.path.join(ONNX_DIR, _hub_name(model_name).replace("/", "__"))
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    int8_path = os.path.join(out_dir, "model.int8.onnx")
+    path = int8_path if quantize else fp32_path
+    if os.path.exists(path):
+        return path
+
+    import torch
+    from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+    print(f"Exporting {model_name} to ONNX (one-time)...")
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(_hub_name(model_name))
+    if kind == "embedder":
+        model = AutoModel.from_pretrained(_hub_name(model_name))
+        dummy = tokenizer(["Harry cast a spell"], return_tensors="pt")
+    else:
+        model = AutoModelForSequenceClassification.from_pretrained(_hub_name(model_name))
+        dummy = tokenizer(["Who is Dobby?"], ["Dobby is a house-elf."], return_tensors="pt")
+    model.eval()
+
+    class Wrapper(torch.nn.Module):
+        """Return a plain tensor (not a ModelOutput) so export is clean"""
+
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.inner(
+                input_ids=input_ids, attention_mask=attention_mask,
+                token_type_ids=token_type_ids
+            )[0]
+
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    torch.onnx.export(
+        Wrapper(model),
+        tuple(dummy[name] for name in input_names),
+        fp32_path,
+        input_names=input_names,
+        output_names=["output"],
+        dynamic_axes={name: {0: "batch", 1: "tokens"} for name in input_names + ["output"]},
+        opset_version=14
+    )
+    print(f"✓ Exported: {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"✓ Quantized to int8: {int8_path}")
+    return path
+
+
+class _OnnxModel:
+    """Tokenizer + onnxruntime session shared by both ONNX wrappers"""
+
+    def __init__(self, model_name, kind, threads=ONNX_THREADS, quantize=ONNX_QUANTIZE):
+        # pip install onnxruntime onnx
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(_hub_name(model_name))
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            _export(model_name, kind, quantize), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _run(self, encoded):
+        feed = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+class OnnxEmbedder(_OnnxModel):
+    """SentenceTransformer-style encode(): mean pooling over tokens"""
+
+    def __init__(self, model_name=EMBEDDING_MODEL, threads=ONNX_THREADS, quantize=ONNX_QUANTIZE):
+        super().__init__(model_name, "embedder", threads, quantize)
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False,
+               show_progress_bar=False, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        outputs = []
+        for start in range(0, len(sentences), batch_size):
+            encoded = self.tokenizer(
+                list(sentences[start:start + batch_size]), padding=True, truncation=True,
+                max_length=EMBEDDING_MAX_TOKENS, return_tensors="np"
+            )
+            token_vectors = self._run(encoded)
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_vectors * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            outputs.append(pooled.astype(np.float32))
+
+        embeddings = np.vstack(outputs) if outputs else np.zeros((0, 0), dtype=np.float32)
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.maximum(norms, 1e-12)
+        return embeddings[0] if single else embeddings
+
+
+class OnnxCrossEncoder(_OnnxModel):
+    """CrossEncoder-style predict(): one relevance logit per (query, passage)"""
+
+    def __init__(self, model_name=RERANKER_MODEL, threads=ONNX_THREADS, quantize=ONNX_QUANTIZE):
+        super().__init__(model_name, "reranker", threads, quantize)
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False, **kwargs):
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            encoded = self.tokenizer(
+                [p[0] for p in batch], [p[1] for p in batch], padding=True,
+                truncation=True, max_length=RERANKER_MAX_TOKENS, return_tensors="np"
+            )
+            scores.append(self._run(encoded)[:, 0])
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+
+# ============================================================
+# MULTI-PROCESS ENCODING
+# ============================================================
+
+_worker_model = None
+
+
+def _init_worker(backend, threads):
+    """Runs once in each worker: cap its threads, then load the model"""
+    global _worker_model
+    # Set before torch / onnxruntime are imported in this (spawned) process
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    if backend == "onnx":
+        _worker_model = OnnxEmbedder(EMBEDDING_MODEL, threads=threads)
+    else:
+        import torch
+        torch.set_num_threads(threads)
+        _worker_model = load_embedder(backend)
+
+
+def _encode_in_worker(texts):
+    return _worker_model.encode(texts, batch_size=len(texts), show_progress_bar=False)
+
+
+class EncoderPool:
+    """
+    Encode batches across worker processes, one model per worker
+
+    ANALOGY: Instead of one librarian with 32 hands getting in each
+    other's way, 32 librarians with one or two hands each, every one
+    at their own desk with their own copy of the model.
+
+    Each worker limits itself to threads_per_worker intra-op threads,
+    so workers × threads ≈ cores. Workers are spawned (not forked):
+    forking after PyTorch has started its thread pool can deadlock.
+    """
+
+    def __init__(self, workers, threads_per_worker=None, backend=INFERENCE_BACKEND):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(backend, self.threads_per_worker)
+        )
+
+    def warm_up(self):
+        """Start every worker and load its model before timing anything"""
+        futures = [self.pool.submit(_encode_in_worker, ["warm up"]) for _ in range(self.workers * 2)]
+        for future in futures:
+            future.result()
+
+    def imap(self, jobs, prefetch=2):
+        """
+        Encode (key, texts) jobs, yielding (key, vectors) in the order given
+
+        Up to workers × prefetch jobs are in flight, so every worker
+        stays busy while results are consumed strictly in order.
+        """
+        in_flight = deque()
+        for key, texts in jobs:
+            in_flight.append((key, self.pool.submit(_encode_in_worker, texts)))
+            if len(in_flight) >= self.workers * prefetch:
+                key, future = in_flight.popleft()
+                yield key, future.result()
+        while in_flight:
+            key, future = in_flight.popleft()
+            yield key, future.result()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
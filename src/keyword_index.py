@@ -0,0 +1,191 @@
+"""
+Keyword Index
+BM25 scoring over a tokenized inverted index
+
+ANALOGY: The Ctrl+F robot used to re-read every index card for
+every question. Now it keeps the index at the back of the book:
+for each word, the list of cards it appears on and how often.
+A question only touches the pages for its own words.
+
+Built once at ingestion (02_embed_chunks.py) and saved next to the
+vector store, so API workers just map the postings from disk.
+"""
+import json
+import os
+import re
+import shutil
+from collections import Counter
+import numpy as np
+from src.config import BM25_K1, BM25_B, KEYWORD_INDEX_DIR
+from src.vectorstore import replace_directory
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """
+    Lowercase word tokens, skipping short ones ("is", "a", "of")
+
+    Same rule the keyword search has always used for query terms,
+    applied to the chunks too so both sides match.
+    """
+    return [
+        term for term in TOKEN_PATTERN.findall(text.lower())
+        if len(term) > 2
+    ]
+
+
+class KeywordIndex:
+    """
+    Inverted index: term → postings (chunk ids + term frequencies)
+
+    Postings are stored CSR-style in flat arrays:
+        postings_docs[offsets[t]:offsets[t + 1]]  → chunk ids for term t
+        postings_tf[offsets[t]:offsets[t + 1]]    → counts in those chunks
+    """
+
+    def __init__(self, vocab, offsets, postings_docs, postings_tf, doc_lens,
+                 k1=BM25_K1, b=BM25_B, store_version=0):
+        self.vocab = vocab
+        self.store_version = store_version
+        self.offsets = offsets
+        self.postings_docs = postings_docs
+        self.postings_tf = postings_tf
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+
+        n_docs = len(doc_lens)
+        avg_len = float(doc_lens.mean()) if n_docs else 0.0
+        doc_freq = np.diff(offsets)
+        # BM25 idf (with +1 so very common terms never go negative)
+        self.idf = np.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        # Length normalization only depends on the chunk, so precompute it
+        self.length_norm = (
+            k1 * (1 - b + b * doc_lens / avg_len) if avg_len else
+            np.full(n_docs, k1, dtype=np.float32)
+        ).astype(np.float32)
+
+    @classmethod
+    def build(cls, texts):
+        """Tokenize every chunk once and build postings"""
+        postings = {}
+        doc_lens = []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        vocab = {}
+        offsets = [0]
+        docs = []
+        tfs = []
+        for term, plist in postings.items():
+            vocab[term] = len(vocab)
+            docs.extend(d for d, _ in plist)
+            tfs.extend(tf for _, tf in plist)
+            offsets.append(len(docs))
+
+        return cls(
+            vocab,
+            np.array(offsets, dtype=np.int64),
+            np.array(docs, dtype=np.int32),
+            np.array(tfs, dtype=np.float32),
+            np.array(doc_lens, dtype=np.float32),
+        )
+
+    def save(self, directory, store_version=0):
+        """
+        Save postings as .npy files (mmap-able) plus the vocab as JSON
+
+        store_version is the vector store build the index was made
+        from; load_keyword_index rebuilds the index when it differs.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.store_version = store_version
+        np.save(os.path.join(directory, "offsets.npy"), self.offsets)
+        np.save(os.path.join(directory, "postings_docs.npy"), self.postings_docs)
+        np.save(os.path.join(directory, "postings_tf.npy"), self.postings_tf)
+        np.save(os.path.join(directory, "doc_lens.npy"), self.doc_lens)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"store_version": store_version}, f)
+        with open(os.path.join(directory, "vocab.json"), "w") as f:
+            json.dump(self.vocab, f)
+
+    @classmethod
+    def load(cls, directory):
+        """Open a saved index with the postings memory-mapped"""
+        with open(os.path.join(directory, "vocab.json")) as f:
+            vocab = json.load(f)
+        arrays = [
+            np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in ["offsets", "postings_docs", "postings_tf", "doc_lens"]
+        ]
+        store_version = 0   # Indexes saved before it was recorded
+        if os.path.exists(os.path.join(directory, "meta.json")):
+            with open(os.path.join(directory, "meta.json")) as f:
+                store_version = json.load(f)["store_version"]
+        return cls(vocab, *arrays, store_version=store_version)
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, "vocab.json"))
+
+    def __len__(self):
+        return len(self.doc_lens)
+
+    def score(self, query):
+        """
+        BM25 score of every chunk for one query, normalized to 0-1
+
+        Only the postings of the query's terms are visited. Chunks
+        that share no term with the query stay at 0.
+        """
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end]
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (
+                tf + self.length_norm[docs]
+            )
+
+        max_score = scores.max() if len(scores) else 0
+        if max_score > 0:
+            scores /= max_score
+        return scores
+
+
+def load_keyword_index(texts_of, n_chunks, store_version=0, directory=KEYWORD_INDEX_DIR):
+    """
+    Open the saved keyword index, rebuilding it if missing or stale
+
+    Stale = built for a different number of chunks or a different
+    store_version (a rebuild can keep the count but change the texts).
+    texts_of is only called (to iterate every chunk text) when the
+    index has to be rebuilt.
+    """
+    if KeywordIndex.exists(directory):
+        index = KeywordIndex.load(directory)
+        if len(index) == n_chunks and index.store_version == store_version:
+            return index
+
+    print("Building keyword index (one-time)...")
+    index = KeywordIndex.build(texts_of())
+    # Built aside and swapped in: other workers may have the old files
+    # mapped, or be rebuilding at the same moment
+    staged_dir = f"{directory}.{os.getpid()}.partial"
+    shutil.rmtree(staged_dir, ignore_errors=True)
+    index.save(staged_dir, store_version=store_version)
+    try:
+        replace_directory(staged_dir, directory)
+    except OSError:
+        # Another worker swapped its (identical) rebuild in first
+        shutil.rmtree(staged_dir, ignore_errors=True)
+        return index
+    print(f"✓ Saved keyword index: {directory}")
+    return index
@@ -0,0 +1,155 @@
+"""
+LLM Client
+One shared, pooled connection to the Anthropic API
+
+ANALOGY: Instead of dialing a new phone call for every question
+(and waiting for the other side to pick up each time), we keep
+the line open and reuse it. If the line is busy (429) or the
+other side hiccups (5xx), we wait a moment and call back.
+
+Used by both query expansion and answer generation, so the two
+calls per /ask share the same warm TLS connections.
+"""
+import asyncio
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from src.config import (
+    ANTHROPIC_API_KEY, ANTHROPIC_API_URL, ANTHROPIC_MODEL,
+    LLM_TIMEOUT, LLM_MAX_RETRIES, LLM_BACKOFF_SECONDS, LLM_POOL_SIZE, LLM_DEADLINE_SECONDS
+)
+
+# Rate limited, server errors, and Anthropic's "overloaded"
+RETRY_STATUSES = {429, 500, 502, 503, 504, 529}
+
+
+class LLMClient:
+    """
+    Keep-alive session for the Messages API, with timeouts and retries
+
+    base_url can point at a local stub server for testing.
+    """
+
+    def __init__(self, api_key=ANTHROPIC_API_KEY, base_url=ANTHROPIC_API_URL,
+                 timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES,
+                 backoff=LLM_BACKOFF_SECONDS, pool_size=LLM_POOL_SIZE,
+                 deadline=LLM_DEADLINE_SECONDS):
+        self.url = base_url.rstrip("/") + "/v1/messages"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.deadline = deadline
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "x-api-key": api_key or "",
+            "anthropic-version": "2023-06-01",
+            "Content-Type": "application/json"
+        })
+
+    def messages(self, system, messages, max_tokens, model=ANTHROPIC_MODEL, deadline=None,
+                 retry_read_timeouts=True):
+        """
+        POST /v1/messages and return the response JSON
+
+        Retries connection errors, timeouts and RETRY_STATUSES with
+        exponential backoff (honouring Retry-After, up to a cap). After
+        the last attempt, an error response is returned as-is and a
+        network error is raised, same as a plain requests.post would.
+
+        deadline (seconds, default LLM_DEADLINE_SECONDS) bounds the
+        whole call, retries included: each attempt's read timeout is
+        cut to the time left, and no retry starts once it has passed
+        (requests.Timeout is raised).
+
+        retry_read_timeouts=False is for calls that shouldn't be sent
+        twice: a read timeout means the server may still be working on
+        (and billing for) the first one, so it is raised at once.
+        """
+        payload = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "system": system,
+            "messages": messages
+        }
+
+        deadline = self.deadline if deadline is None else deadline
+        expires = time.monotonic() + deadline if deadline is not None else None
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            timeout = self.timeout
+            if expires is not None:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    raise requests.Timeout(f"LLM call deadline of {deadline}s exceeded")
+                connect_timeout, read_timeout = self.timeout
+                timeout = (min(connect_timeout, remaining), min(read_timeout, remaining))
+            try:
+                response = self.session.post(self.url, json=payload, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last_attempt or (isinstance(e, requests.ReadTimeout) and not retry_read_timeouts):
+                    raise
+                self._wait(attempt, expires=expires)
+                continue
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                self._wait(attempt, response.headers.get("retry-after"), expires)
+                continue
+
+            try:
+                return response.json()
+            except ValueError:
+                return {"error": {"message": f"HTTP {response.status_code}"}}
+
+    def _wait(self, attempt, retry_after=None, expires=None):
+        """Sleep before the next attempt: Retry-After (capped), else jittered backoff"""
+        try:
+            # A server asking for minutes shouldn't stall a request for minutes
+            delay = min(float(retry_after), self.backoff * (2 ** attempt) * 4)
+        except (TypeError, ValueError):
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+        if expires is not None:
+            delay = min(delay, max(expires - time.monotonic(), 0))
+        time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncLLMClient:
+    """
+    asyncio variant of LLMClient
+
+    Runs the pooled client in a worker thread, so coroutines can
+    await LLM calls (and run several at once) while still sharing
+    the same keep-alive connections.
+    """
+
+    def __init__(self, client=None):
+        self.client = client or get_client()
+
+    async def messages(self, system, messages, max_tokens, model=ANTHROPIC_MODEL, deadline=None,
+                       retry_read_timeouts=True):
+        return await asyncio.to_thread(
+            self.client.messages, system, messages, max_tokens, model, deadline,
+            retry_read_timeouts
+        )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide LLMClient, created on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
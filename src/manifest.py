@@ -0,0 +1,64 @@
+"""
+Ingestion Manifest
+Content hashes of every source file and every chunk in the vector store
+
+ANALOGY: The librarian's accession register. Each book that came in
+is listed with a fingerprint of its pages, and each index card with
+a fingerprint of its text. When a new delivery arrives, only books
+whose fingerprint changed get re-read, and only cards whose text is
+new get re-filed — the rest are copied over as they are.
+
+manifest.json (next to the embeddings):
+{
+  "store_version": 3,                   bumped on every rebuild that changes rows
+  "model": "all-MiniLM-L6-v2",          embeddings are only reused for the same
+  "inference_backend": "torch",         model and backend
+  "files": {"book.pdf": "<sha256>"},    source files in the store
+  "chunker": "sentences:...:254:48",    chunking settings the files were cut with
+  "dedup": "minhash:5:128:16:0.8",      near-duplicate settings (null if disabled)
+  "chunks": ["<sha1>", ...]             one per embedding row, in row order
+}
+
+01_load_and_chunk.py uses "files" to skip unchanged PDFs, and
+02_embed_chunks.py uses "chunks" to reuse embedding rows.
+"""
+import hashlib
+import json
+import os
+from src.config import MANIFEST_PATH
+
+
+def file_hash(path, block_size=1 << 20):
+    """SHA-256 of a file's bytes, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(text):
+    """SHA-1 of a chunk's text (the only input to its embedding)"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def rows_hash(hashes):
+    """One SHA-1 for a whole list of chunk hashes (what an embedding matrix holds, in order)"""
+    return hashlib.sha1("\n".join(hashes).encode("utf-8")).hexdigest()
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """Read a manifest (empty dict if there isn't one yet)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Write atomically, so a crash never leaves a half-written manifest"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
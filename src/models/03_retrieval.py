@@ -26,7 +26,7 @@ Each card has a book passage written on it.
 - GENERATION is handing those 5 cards to a reader (Claude) and
   saying "answer this question using ONLY what's on these cards."
 """
-import pickle
+import sys
 import numpy as np
 from numpy.linalg import norm
 from sentence_transformers import SentenceTransformer
@@ -35,6 +35,11 @@ import json
 import os
 from dotenv import load_dotenv
 
+# Add project root to path so we can import src modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.vectorstore import load_chunks
+from src.ranking import top_k_indices
+
 load_dotenv()
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 
@@ -49,8 +54,7 @@ print("=" * 60)
 # in the 384-dimensional room. We prepared these in Phase 2.
 print("\nLoading vector store...")
 embeddings = np.load("data/vectorstore/embeddings.npy")
-with open("data/vectorstore/chunks.pkl", "rb") as f:
-    chunks = pickle.load(f)
+chunks = load_chunks()
 print(f"✓ Loaded {len(chunks)} chunks with {embeddings.shape[1]}-dim vectors")
 
 # ============================================================
@@ -100,7 +104,7 @@ def retrieve(query, top_k=5):
     # STEP 3: Grab the top_k most similar chunks
     # ANALOGY: The librarian picks up the 5 closest cards and
     # hands them to you, sorted by relevance
-    top_indices = np.argsort(similarities)[::-1][:top_k]
+    top_indices = top_k_indices(similarities, top_k)
 
     results = []
     for idx in top_indices:
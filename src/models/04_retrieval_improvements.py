@@ -30,7 +30,7 @@ Before, we had one librarian doing one search. Now we have a team:
    result more carefully and asks "does this ACTUALLY answer the
    question?" Bad results get filtered out. Good ones get boosted.
 """
-import pickle
+import sys
 import numpy as np
 from numpy.linalg import norm
 from sentence_transformers import SentenceTransformer, CrossEncoder
@@ -40,6 +40,11 @@ import os
 import re
 from dotenv import load_dotenv
 
+# Add project root to path so we can import src modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.vectorstore import load_chunks
+from src.ranking import top_k_indices
+
 load_dotenv()
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 
@@ -57,8 +62,7 @@ print("=" * 60)
 # in the 384-dimensional room.
 print("\nLoading vector store...")
 embeddings = np.load("data/vectorstore/embeddings.npy")
-with open("data/vectorstore/chunks.pkl", "rb") as f:
-    chunks = pickle.load(f)
+chunks = load_chunks()
 print(f"✓ Loaded {len(chunks)} chunks with {embeddings.shape[1]}-dim vectors")
 
 # ============================================================
@@ -246,7 +250,7 @@ def retrieve(query, top_k=10, semantic_weight=0.7, keyword_weight=0.3,
 
     # Get initial candidates (grab more than we need for re-ranking)
     n_candidates = top_k * 3 if use_reranker else top_k
-    top_indices = np.argsort(combined_scores)[::-1][:n_candidates]
+    top_indices = top_k_indices(combined_scores, n_candidates)
 
     candidates = []
     for idx in top_indices:
@@ -7,11 +7,50 @@ ANALOGY: A translator who rephrases your question multiple
 ways before the librarian searches. Catches cases where your
 wording doesn't match how the books phrase things.
 """
-import requests
-from src.config import ANTHROPIC_API_KEY, ANTHROPIC_MODEL
+import hashlib
+import re
+from src.config import (
+    ANTHROPIC_MODEL, EXPANSION_CACHE_SIZE, EXPANSION_CACHE_TTL, EXPANSION_CACHE_PATH,
+    EXPANSION_CACHE_DISK_ENTRIES
+)
+from src.cache import LRUCache, SQLiteCache
+from src.llm_client import get_client
+
+SYSTEM_PROMPT = """Generate 3 alternative phrasings of the user's question
+for searching through Harry Potter book text. Think about how the
+information would actually be written in the books. Return ONLY the
+3 phrasings, one per line, no numbering or extra text."""
+
+# Changing the model or the prompt changes the namespace, which
+# invalidates everything cached under the old one
+CACHE_NAMESPACE = ANTHROPIC_MODEL + ":" + hashlib.sha1(SYSTEM_PROMPT.encode()).hexdigest()[:12]
+
+# Two tiers: in-process LRU first, then (optionally) SQLite on disk
+memory_cache = LRUCache(EXPANSION_CACHE_SIZE, ttl=EXPANSION_CACHE_TTL)
+disk_cache = (
+    SQLiteCache(EXPANSION_CACHE_PATH, CACHE_NAMESPACE, EXPANSION_CACHE_DISK_ENTRIES,
+                ttl=EXPANSION_CACHE_TTL)
+    if EXPANSION_CACHE_PATH else None
+)
 
 
-def expand_query(query):
+def normalize_query(query):
+    """
+    Cache key form of a question: lowercase words only
+
+    "Who is Dobby?" and "who is  dobby" land on the same entry.
+    """
+    return " ".join(re.findall(r'\w+', query.lower()))
+
+
+def cache_stats():
+    return {
+        "memory": memory_cache.stats(),
+        "disk": disk_cache.stats() if disk_cache else None
+    }
+
+
+def expand_query(query, deadline=None):
     """
     Generate alternative phrasings using Claude
 
@@ -22,31 +61,35 @@ def expand_query(query):
         "Harry's patronus took the shape of a stag",
         "A silvery stag emerged from Harry's wand"
     ]
+
+    Repeated questions are served from the cache (memory, then
+    disk) without calling Claude. Failed calls are never cached.
+    deadline (seconds) caps the Claude call, retries included.
     """
-    response = requests.post(
-        "https://api.anthropic.com/v1/messages",
-        headers={
-            "x-api-key": ANTHROPIC_API_KEY,
-            "anthropic-version": "2023-06-01",
-            "Content-Type": "application/json"
-        },
-        json={
-            "model": ANTHROPIC_MODEL,
-            "max_tokens": 256,
-            "system": """Generate 3 alternative phrasings of the user's question
-for searching through Harry Potter book text. Think about how the
-information would actually be written in the books. Return ONLY the
-3 phrasings, one per line, no numbering or extra text.""",
-            "messages": [{"role": "user", "content": query}]
-        }
-    )
+    key = CACHE_NAMESPACE + ":" + normalize_query(query)
+    expanded = memory_cache.get(key)
+    if expanded is None and disk_cache is not None:
+        expanded = disk_cache.get(key)
+        if expanded is not None:
+            memory_cache.set(key, expanded)
+
+    if expanded is None:
+        data = get_client().messages(
+            system=SYSTEM_PROMPT,
+            messages=[{"role": "user", "content": query}],
+            max_tokens=256,
+            deadline=deadline
+        )
+
+        if "content" not in data:
+            return [query]
 
-    data = response.json()
-    if "content" not in data:
-        return [query]
+        expanded = data["content"][0]["text"].strip().split("\n")
+        expanded = [q.strip() for q in expanded if q.strip()]
 
-    expanded = data["content"][0]["text"].strip().split("\n")
-    expanded = [q.strip() for q in expanded if q.strip()]
+        memory_cache.set(key, expanded)
+        if disk_cache is not None:
+            disk_cache.set(key, expanded)
 
     # Always include original query
     return [query] + expanded
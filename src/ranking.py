@@ -0,0 +1,28 @@
+"""
+Ranking helpers
+Pick the top-k scores without sorting everything
+
+ANALOGY: To find the 30 tallest people in a stadium you don't
+line up all 13,000 by height. You pull out everyone taller than
+the 30th tallest (one pass), then only sort those 30.
+"""
+import numpy as np
+
+
+def top_k_indices(scores, k):
+    """
+    Indices of the k highest scores, best first
+
+    np.argpartition finds the k largest in O(n), then only those
+    k get sorted: O(n + k log k) instead of O(n log n).
+    """
+    scores = np.asarray(scores)
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(n)
+    return top[np.argsort(-scores[top], kind="stable")]
@@ -8,16 +8,107 @@ ANALOGY: This is the library's search system.
 - Hybrid = combining both (70/30 split)
 - Re-ranker = senior librarian who double-checks results
 """
-import pickle
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 import numpy as np
-from numpy.linalg import norm
-from sentence_transformers import SentenceTransformer, CrossEncoder
-import re
 from src.config import (
-    EMBEDDING_MODEL, RERANKER_MODEL, EMBEDDINGS_PATH, CHUNKS_PATH,
-    DEFAULT_TOP_K, SEMANTIC_WEIGHT, KEYWORD_WEIGHT
+    RERANKER_MODEL, INFERENCE_BACKEND,
+    DEFAULT_TOP_K, SEMANTIC_WEIGHT, KEYWORD_WEIGHT,
+    PIPELINED_SEARCH, EXPANSION_BUDGET_SECONDS, EXPANSION_WORKERS, QUERY_EMBEDDING_CACHE_SIZE,
+    USE_MICROBATCHING, MICROBATCH_MAX_WAIT_MS, MICROBATCH_MAX_BATCH, RERANK_CACHE_SIZE,
+    RERANK_CASCADE, CASCADE_STEP, CASCADE_MARGIN, CASCADE_AGREEMENT
 )
+from src.cache import LRUCache
 from src.query_expander import expand_query
+from src.keyword_index import load_keyword_index
+from src.vectorstore import load_embeddings, load_chunks, load_meta
+from src.ranking import top_k_indices
+from src.vector_index import load_vector_index
+from src.inference import load_embedder, load_reranker
+
+
+class MicroBatcher:
+    """
+    Coalesces small model calls from concurrent requests into one batch
+
+    ANALOGY: Instead of the librarian running to the stacks once per
+    visitor, they wait a few milliseconds at the desk, collect
+    everyone's requests, and make ONE trip for all of them.
+
+    fn takes a list of items and returns one result per item. Callers
+    submit() their own small list and block until their slice of the
+    batched result comes back. A background thread collects jobs for
+    up to max_wait_ms (or until max_batch items), runs fn once, and
+    hands each caller its results.
+
+    contended() says whether anyone else could be about to submit.
+    When it's False and nothing else is queued, a job runs at once:
+    a lone request never pays max_wait_ms for a batch of one.
+    """
+
+    def __init__(self, fn, max_wait_ms=MICROBATCH_MAX_WAIT_MS,
+                 max_batch=MICROBATCH_MAX_BATCH, name="microbatch", contended=None):
+        self.fn = fn
+        self.contended = contended
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self.jobs = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self.worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self.worker.start()
+
+    def submit(self, items):
+        """Run fn on items as part of the next batch; returns its results"""
+        future = Future()
+        self.jobs.put((list(items), future))
+        return future.result()
+
+    def _collect(self):
+        """Block for one job, then gather more until the wait or size limit"""
+        jobs = [self.jobs.get()]
+        n_items = len(jobs[0][0])
+        if self.jobs.empty() and self.contended is not None and not self.contended():
+            return jobs   # Nobody to wait for
+        deadline = time.monotonic() + self.max_wait
+        while n_items < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self.jobs.get(timeout=remaining)
+            except queue.Empty:
+                break
+            jobs.append(job)
+            n_items += len(job[0])
+        return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._collect()
+            items = [item for job_items, _ in jobs for item in job_items]
+            try:
+                results = self.fn(items)
+            except Exception as e:
+                for _, future in jobs:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(items)
+            offset = 0
+            for job_items, future in jobs:
+                future.set_result(results[offset:offset + len(job_items)])
+                offset += len(job_items)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": self.items / self.batches if self.batches else 0.0
+        }
 
 
 class Retriever:
@@ -34,19 +125,103 @@ class Retriever:
     def __init__(self):
         """Load all data and models on initialization"""
         print("Loading vector store...")
-        self.embeddings = np.load(EMBEDDINGS_PATH)
-        with open(CHUNKS_PATH, "rb") as f:
-            self.chunks = pickle.load(f)
+        # Both memory-mapped: API workers share one copy in the page cache
+        self.embeddings = load_embeddings()
+        self.chunks = load_chunks()
+        self._check_store()
         print(f"✓ Loaded {len(self.chunks)} chunks with {self.embeddings.shape[1]}-dim vectors")
+        self.vector_index = load_vector_index(self.embeddings)
+        print(f"✓ Semantic backend: {self.vector_index.name}")
+
+        self.keyword_index = load_keyword_index(
+            self.chunks.texts, len(self.chunks), load_meta().get("store_version", 0)
+        )
+        print(f"✓ Keyword index: {len(self.keyword_index.vocab)} terms")
 
-        print("Loading embedding model...")
-        self.embed_model = SentenceTransformer(EMBEDDING_MODEL)
+        print(f"Loading embedding model ({INFERENCE_BACKEND})...")
+        self.embed_model = load_embedder()
+        self.query_embedding_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
         print("✓ Embedding model loaded")
 
-        print("Loading re-ranker...")
-        self.reranker = CrossEncoder(RERANKER_MODEL)
+        print(f"Loading re-ranker ({INFERENCE_BACKEND})...")
+        self.reranker = load_reranker()
+        # (reranker model, normalized query, chunk_id) → score. Chunk ids
+        # are stable for the life of the process (the store is loaded once)
+        self.rerank_cache = LRUCache(RERANK_CACHE_SIZE)
+        self.rerank_counters = {"requests": 0, "pairs_scored": 0, "pairs_cached": 0}
+        self._counters_lock = threading.Lock()   # Updated from concurrent requests
         print("✓ Re-ranker loaded")
 
+        # Runs query expansion in the background while we search. Never
+        # queued: a request that finds every thread busy skips expansion
+        self.expansion_pool = ThreadPoolExecutor(
+            max_workers=EXPANSION_WORKERS, thread_name_prefix="expansion"
+        )
+        self.expansions_in_flight = 0
+        self._expansion_lock = threading.Lock()
+
+        # Concurrent requests share encode / rerank batches. Batchers
+        # only wait for company while more than one search is running
+        self.active_searches = 0
+        self._active_lock = threading.Lock()
+        if USE_MICROBATCHING:
+            contended = lambda: self.active_searches > 1
+            self.encode_batcher = MicroBatcher(self._encode_now, name="encode-batcher",
+                                               contended=contended)
+            self.rerank_batcher = MicroBatcher(self.reranker.predict, name="rerank-batcher",
+                                               contended=contended)
+        else:
+            self.encode_batcher = self.rerank_batcher = None
+
+    def _check_store(self):
+        """Refuse to serve a store whose embeddings and chunks are from different builds"""
+        if len(self.embeddings) != len(self.chunks):
+            raise RuntimeError(
+                f"Vector store is inconsistent: {len(self.embeddings)} embeddings but "
+                f"{len(self.chunks)} chunks. Re-run src/data/02_embed_chunks.py"
+            )
+        store_version = load_meta().get("store_version", 0)
+        if self.chunks.store_version is not None and self.chunks.store_version != store_version:
+            raise RuntimeError(
+                f"Vector store is inconsistent: embeddings are store version {store_version}, "
+                f"chunks are {self.chunks.store_version}. Re-run src/data/02_embed_chunks.py"
+            )
+
+    def _encode_now(self, texts):
+        return self.embed_model.encode(texts, normalize_embeddings=True).astype(np.float32)
+
+    def _encode(self, texts):
+        """Unit-norm embeddings, via the micro-batcher when enabled"""
+        if self.encode_batcher:
+            return self.encode_batcher.submit(texts)
+        return self._encode_now(texts)
+
+    def _predict(self, pairs):
+        """Cross-encoder scores, via the micro-batcher when enabled"""
+        if self.rerank_batcher:
+            return self.rerank_batcher.submit(pairs)
+        return self.reranker.predict(pairs)
+
+    def encode_queries(self, queries):
+        """
+        Embed all query phrasings in one batch (unit-norm float32)
+
+        Phrasings seen recently come from an LRU cache (Claude tends
+        to produce the same rewrites, like "Expecto Patronum"). The
+        rest go through ONE encode call for the whole batch.
+        """
+        queries = list(queries)
+        vectors = [self.query_embedding_cache.get(q) for q in queries]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+
+        if missing:
+            encoded = self._encode([queries[i] for i in missing])
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+                self.query_embedding_cache.set(queries[i], vector)
+
+        return np.stack(vectors)
+
     def _semantic_search(self, queries):
         """
         Search by meaning across all chunks
@@ -55,48 +230,52 @@ class Retriever:
         the right area of the 384-dimensional room, and scores
         every card by distance. A chunk that matches multiple
         phrasings gets the highest score from any of them.
+
+        Stored chunk vectors and query vectors are both unit length,
+        so cosine similarity is a dot product. All phrasings are
+        scored together by the configured vector index (exact scan
+        or IVF), reduced with a max across the queries.
         """
-        scores = np.zeros(len(self.chunks))
-        for q in queries:
-            query_vector = self.embed_model.encode([q])[0]
-            similarities = np.dot(self.embeddings, query_vector) / (
-                norm(self.embeddings, axis=1) * norm(query_vector)
-            )
-            scores = np.maximum(scores, similarities)
-        return scores
+        return self.vector_index.score(self.encode_queries(queries))
 
     def _keyword_search(self, queries):
         """
-        Search by exact word matching across all chunks
+        Search by exact word matching across all chunks (BM25)
 
-        ANALOGY: Ctrl+F robot scans every chunk for exact words.
-        Good for names (Dobby), spells (Expelliarmus), and
-        specific terms that semantic search might miss.
+        ANALOGY: Ctrl+F robot looks each word up in the index at the
+        back of the book instead of re-reading every chunk. Good for
+        names (Dobby), spells (Expelliarmus), and specific terms that
+        semantic search might miss.
         """
         all_scores = np.zeros(len(self.chunks))
-
         for query in queries:
-            query_terms = [
-                term.lower() for term in re.findall(r'\w+', query)
-                if len(term) > 2
-            ]
+            all_scores = np.maximum(all_scores, self.keyword_index.score(query))
+        return all_scores
 
-            scores = []
-            for chunk in self.chunks:
-                text_lower = chunk['text'].lower()
-                score = sum(text_lower.count(term) for term in query_terms)
-                scores.append(score)
+    def _score_pairs(self, query, candidates):
+        """
+        Set "rerank_score" on each candidate; returns how many pairs
+        the model actually scored
 
-            scores = np.array(scores, dtype=float)
-            max_score = scores.max()
-            if max_score > 0:
-                scores = scores / max_score
+        Scores for (question, chunk) pairs seen before come from the
+        rerank cache; only the rest are sent to the model.
+        """
+        query_key = " ".join(query.lower().split())
+        keys = [(RERANKER_MODEL, query_key, c["chunk_id"]) for c in candidates]
+        rerank_scores = [self.rerank_cache.get(key) for key in keys]
 
-            all_scores = np.maximum(all_scores, scores)
+        missing = [i for i, score in enumerate(rerank_scores) if score is None]
+        if missing:
+            pairs = [[query, candidates[i]["text"]] for i in missing]
+            for i, score in zip(missing, self._predict(pairs)):
+                rerank_scores[i] = float(score)
+                self.rerank_cache.set(keys[i], rerank_scores[i])
 
-        return all_scores
+        for i, score in enumerate(rerank_scores):
+            candidates[i]["rerank_score"] = score
+        return len(missing)
 
-    def _rerank(self, query, candidates):
+    def _rerank(self, query, candidates, top_k, cascade=RERANK_CASCADE):
         """
         Re-rank candidates using CrossEncoder
 
@@ -106,18 +285,143 @@ class Retriever:
 
         CrossEncoder reads (question, passage) as a PAIR — unlike
         cosine similarity which compares vectors independently.
+
+        CASCADE: candidates arrive in hybrid order. The librarian
+        reads the first top_k, then stops early if the result is
+        already clear — a decisive winner (top-2 rerank gap ≥
+        CASCADE_MARGIN) or the reranker's best half mostly matching
+        the hybrid's best half (overlap ≥ CASCADE_AGREEMENT).
+        Otherwise the next CASCADE_STEP candidates are read, and so on.
+
+        Returns (re-ranked candidates, stats dict for this request).
         """
-        pairs = [[query, c["text"]] for c in candidates]
-        rerank_scores = self.reranker.predict(pairs)
+        n_scored = len(candidates)
+        if cascade:
+            n_scored = min(top_k, len(candidates))
 
-        for i, score in enumerate(rerank_scores):
-            candidates[i]["rerank_score"] = float(score)
+        pairs_scored = self._score_pairs(query, candidates[:n_scored])
+        while n_scored < len(candidates) and not self._cascade_done(candidates[:n_scored], top_k):
+            step = candidates[n_scored:n_scored + CASCADE_STEP]
+            pairs_scored += self._score_pairs(query, step)
+            n_scored += len(step)
+
+        stats = {
+            "rerank_candidates": len(candidates),
+            "rerank_pairs_considered": n_scored,
+            "rerank_pairs_scored": pairs_scored
+        }
+        with self._counters_lock:
+            self.rerank_counters["requests"] += 1
+            self.rerank_counters["pairs_scored"] += pairs_scored
+            self.rerank_counters["pairs_cached"] += n_scored - pairs_scored
+
+        # Only re-ranked candidates compete for the final top_k
+        reranked = sorted(candidates[:n_scored], key=lambda x: x["rerank_score"], reverse=True)
+        return reranked, stats
+
+    def _cascade_done(self, scored, top_k):
+        """Is the ranking of the candidates scored so far unambiguous?"""
+        by_rerank = sorted(scored, key=lambda x: x["rerank_score"], reverse=True)
+        if len(by_rerank) > 1 and (
+            by_rerank[0]["rerank_score"] - by_rerank[1]["rerank_score"] >= CASCADE_MARGIN
+        ):
+            return True
+
+        # scored is in hybrid order. Compare the best half by each ranking:
+        # if the reranker's favourites are the hybrid's favourites, deeper
+        # hybrid candidates are unlikely to beat them
+        m = max(1, top_k // 2)
+        hybrid_top = {c["chunk_id"] for c in scored[:m]}
+        rerank_top = {c["chunk_id"] for c in by_rerank[:m]}
+        return len(hybrid_top & rerank_top) / m >= CASCADE_AGREEMENT
+
+    def rerank_stats(self):
+        """Average re-rank work per request since startup"""
+        with self._counters_lock:
+            counters = dict(self.rerank_counters)
+        requests = counters["requests"]
+        return {
+            **counters,
+            "avg_pairs_scored": counters["pairs_scored"] / requests if requests else 0.0
+        }
+
+    def _submit_expansion(self, query):
+        """
+        Start expand_query in the background, or None if the pool is saturated
+
+        The call gets the client's own deadline (LLM_DEADLINE_SECONDS),
+        not the search budget: a search that stops waiting leaves it
+        running, so a slow expansion still lands in the cache for the
+        next time the question is asked.
+        """
+        with self._expansion_lock:
+            if self.expansions_in_flight >= EXPANSION_WORKERS:
+                return None
+            self.expansions_in_flight += 1
+        future = self.expansion_pool.submit(expand_query, query)
+        future.add_done_callback(self._expansion_done)
+        return future
+
+    def _expansion_done(self, future):
+        with self._expansion_lock:
+            self.expansions_in_flight -= 1
 
-        candidates.sort(key=lambda x: x["rerank_score"], reverse=True)
-        return candidates
+    def _pipelined_scores(self, query):
+        """
+        Score the original query while expansion is still in flight
+
+        ANALOGY: The librarian and robot start searching with your
+        exact question right away instead of standing around while
+        the translator thinks. When the translator's rephrasings
+        arrive, they search those too and keep the best score per
+        card. If the translator takes longer than the budget, we go
+        with what we already have; the translator finishes anyway and
+        files the rephrasings for next time (the expansion cache).
+
+        Returns (queries actually used, semantic scores, keyword scores).
+        """
+        started = time.perf_counter()
+        expansion = self._submit_expansion(query)
+
+        semantic_scores = self._semantic_search([query])
+        kw_scores = self._keyword_search([query])
+
+        if expansion is None:
+            print("  Query expansion pool busy, using original query only")
+            return [query], semantic_scores, kw_scores
+
+        remaining = EXPANSION_BUDGET_SECONDS - (time.perf_counter() - started)
+        try:
+            expanded = expansion.result(timeout=max(remaining, 0))
+        except FutureTimeout:
+            print(f"  Query expansion over {EXPANSION_BUDGET_SECONDS}s budget, "
+                  "using original query only")
+            return [query], semantic_scores, kw_scores
+        except Exception as e:
+            print(f"  Query expansion failed ({e}), using original query only")
+            return [query], semantic_scores, kw_scores
+
+        extra = [q for q in expanded if q != query]
+        if extra:
+            semantic_scores = np.maximum(semantic_scores, self._semantic_search(extra))
+            kw_scores = np.maximum(kw_scores, self._keyword_search(extra))
+        return [query] + extra, semantic_scores, kw_scores
 
     def search(self, query, top_k=DEFAULT_TOP_K,
-               use_expansion=True, use_reranker=True):
+               use_expansion=True, use_reranker=True, pipelined=PIPELINED_SEARCH,
+               stats=None):
+        """Run _search, counted in active_searches (micro-batchers read it)"""
+        with self._active_lock:
+            self.active_searches += 1
+        try:
+            return self._search(query, top_k, use_expansion, use_reranker, pipelined, stats)
+        finally:
+            with self._active_lock:
+                self.active_searches -= 1
+
+    def _search(self, query, top_k=DEFAULT_TOP_K,
+                use_expansion=True, use_reranker=True, pipelined=PIPELINED_SEARCH,
+                stats=None):
         """
         Full retrieval pipeline: expand → hybrid search → re-rank
 
@@ -127,38 +431,53 @@ class Retriever:
         3. Robot searches by exact words (keyword)
         4. Scores combined 70/30
         5. Senior librarian re-checks top results (re-rank)
+
+        With pipelined=True, steps 1-3 overlap: the original query is
+        scored while expansion runs (see _pipelined_scores).
+
+        Pass a dict as stats to get per-request counters back (how
+        many re-rank pairs were considered / actually scored).
         """
-        # Step 1: Expand query
-        if use_expansion:
-            queries = expand_query(query)
+        if use_expansion and pipelined:
+            # Steps 1-3 at once: expand in the background, search meanwhile
+            queries, semantic_scores, kw_scores = self._pipelined_scores(query)
         else:
-            queries = [query]
+            # Step 1: Expand query
+            if use_expansion:
+                queries = expand_query(query)
+            else:
+                queries = [query]
 
-        # Step 2: Semantic search
-        semantic_scores = self._semantic_search(queries)
+            # Step 2: Semantic search
+            semantic_scores = self._semantic_search(queries)
 
-        # Step 3: Keyword search
-        kw_scores = self._keyword_search(queries)
+            # Step 3: Keyword search
+            kw_scores = self._keyword_search(queries)
 
         # Step 4: Combine scores
         combined = (SEMANTIC_WEIGHT * semantic_scores) + (KEYWORD_WEIGHT * kw_scores)
 
         # Get candidates (extra for re-ranking)
         n_candidates = top_k * 3 if use_reranker else top_k
-        top_indices = np.argsort(combined)[::-1][:n_candidates]
+        top_indices = top_k_indices(combined, n_candidates)
 
+        # Only the candidates are read from the chunk store
         candidates = []
-        for idx in top_indices:
+        for idx, chunk in zip(top_indices, self.chunks.take(top_indices)):
             candidates.append({
                 "chunk_id": int(idx),
-                "text": self.chunks[idx]["text"],
-                "source": self.chunks[idx]["source"],
+                "text": chunk["text"],
+                "source": chunk["source"],
+                "page": chunk.get("page"),
+                "refs": chunk.get("refs", []),
                 "semantic_score": float(semantic_scores[idx]),
                 "keyword_score": float(kw_scores[idx])
             })
 
         # Step 5: Re-rank
         if use_reranker:
-            candidates = self._rerank(query, candidates)
+            candidates, rerank_stats = self._rerank(query, candidates, top_k)
+            if stats is not None:
+                stats.update(rerank_stats)
 
         return candidates[:top_k], queries
@@ -0,0 +1,155 @@
+"""
+Semantic Answer Cache
+Reuse a previous answer when a new question means the same thing
+
+ANALOGY: The librarian remembers recent questions by meaning, not
+by exact wording. "How did Harry get his scar?" and "Where did
+Harry's scar come from?" land in the same spot of the 384-dim
+room, so the second one gets the answer already written down
+for the first — no translator, no search, no reader.
+
+Questions are stored as unit vectors in a small fixed-size table.
+A lookup is one dot product against the table; a hit needs cosine
+similarity ≥ threshold AND the same request settings (top_k etc).
+When the table is full, the least recently used entry is replaced.
+
+SNAPSHOT: one .npz file holding the vectors and the entries together,
+written to a temp file and renamed into place, so a reader never
+sees vectors from one save next to entries from another. With
+several API workers only one of them — whichever holds the lock
+file — writes it; the others only read it on startup.
+"""
+import fcntl
+import json
+import os
+import threading
+import numpy as np
+from src.config import (
+    SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_PATH,
+    EMBEDDING_MODEL, ANTHROPIC_MODEL
+)
+
+# A snapshot made with different models (or an older store version) is not reused
+NAMESPACE = f"{EMBEDDING_MODEL}:{ANTHROPIC_MODEL}"
+
+
+class SemanticCache:
+    """Bounded vector table of (question embedding → cached response)"""
+
+    def __init__(self, dim, capacity=SEMANTIC_CACHE_SIZE,
+                 threshold=SEMANTIC_CACHE_THRESHOLD, snapshot_path=SEMANTIC_CACHE_PATH,
+                 store_version=0):
+        self.capacity = capacity
+        self.namespace = f"{NAMESPACE}:{store_version}"
+        self.threshold = threshold
+        self.snapshot_path = snapshot_path
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.settings = [None] * capacity
+        self.values = [None] * capacity
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._writer_lock = None
+
+    def _settings_key(self, settings):
+        return json.dumps(settings, sort_keys=True)
+
+    def lookup(self, vector, settings):
+        """Cached value for the closest matching question, or None"""
+        key = self._settings_key(settings)
+        with self._lock:
+            if self.size:
+                similarities = self.vectors[:self.size] @ vector
+                for slot in np.argsort(-similarities):
+                    if similarities[slot] < self.threshold:
+                        break
+                    if self.settings[slot] == key:
+                        self.clock += 1
+                        self.last_used[slot] = self.clock
+                        self.hits += 1
+                        return self.values[slot]
+            self.misses += 1
+            return None
+
+    def add(self, vector, settings, value):
+        """Store a response, evicting the least recently used when full"""
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            if self.size < self.capacity:
+                slot = self.size
+                self.size += 1
+            else:
+                slot = int(np.argmin(self.last_used))
+            self.clock += 1
+            self.vectors[slot] = vector
+            self.settings[slot] = self._settings_key(settings)
+            self.values[slot] = value
+            self.last_used[slot] = self.clock
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": self.size,
+            "maxsize": self.capacity
+        }
+
+    def claim_writer(self):
+        """
+        Become the one process that saves the snapshot, if no other has
+
+        The lock is held (by the open file) until this process exits.
+        Returns True if this process is the writer.
+        """
+        if not self.snapshot_path:
+            return False
+        if self._writer_lock is None:
+            os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+            lock_file = open(self.snapshot_path + ".lock", "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return False
+            self._writer_lock = lock_file
+        return True
+
+    def save(self):
+        """Atomically write a snapshot (.npz), if this process is the writer"""
+        if not self.claim_writer():
+            return
+        with self._lock:
+            order = np.argsort(self.last_used[:self.size])   # oldest first
+            entries = {
+                "namespace": self.namespace,
+                "count": len(order),
+                "settings": [self.settings[i] for i in order],
+                "values": [self.values[i] for i in order]
+            }
+            vectors = self.vectors[order]
+        tmp_path = f"{self.snapshot_path}.npz.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, vectors=vectors, entries=np.array(json.dumps(entries)))
+        os.replace(tmp_path, self.snapshot_path + ".npz")
+
+    def load(self):
+        """Restore a snapshot if one exists, is complete and was made with the same models"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path + ".npz"):
+            return
+        with np.load(self.snapshot_path + ".npz") as snapshot:
+            vectors = snapshot["vectors"]
+            entries = json.loads(str(snapshot["entries"]))
+        if entries["namespace"] != self.namespace:
+            return
+        if vectors.shape[1:] != self.vectors.shape[1:]:
+            return
+        if not (entries["count"] == len(vectors) == len(entries["settings"]) == len(entries["values"])):
+            return
+        for vector, settings, value in zip(vectors, entries["settings"], entries["values"]):
+            self.add(vector, json.loads(settings), value)
@@ -0,0 +1,420 @@
+"""
+Vector Indexes
+Pluggable backends for the semantic half of hybrid search
+
+ANALOGY: Different ways for the librarian to find the nearest
+cards in the 384-dimensional room.
+- Exact = walk past every single card and measure (always right,
+  slower as the library grows)
+- IVF = the room is divided into neighbourhoods. Check which
+  neighbourhoods your question lands near, then only measure the
+  cards living there (much faster, occasionally misses a card)
+- Int8 = measure every card with a cheap, slightly blurry ruler,
+  then re-measure the closest few hundred with the precise one
+- PQ = every card's location is written as a short code ("district
+  12, street 40, ...") and distances come from lookup tables built
+  once per question. Tiny memory, rougher measurements, optional
+  precise re-measure of a shortlist
+
+Every backend answers the same question: "how similar is each
+chunk to the closest query phrasing?" as a dense 0-1 score array,
+so the hybrid combiner in Retriever.search doesn't care which one
+is plugged in. Chunks a backend never looked at score 0.
+"""
+import os
+import numpy as np
+from src.config import (
+    VECTOR_INDEX, IVF_INDEX_PATH, IVF_NLIST, IVF_NPROBE, INT8_RESCORE_CANDIDATES,
+    PQ_INDEX_PATH, PQ_SUBSPACES, PQ_RERANK_CANDIDATES
+)
+from src.ranking import top_k_indices
+from src.vectorstore import load_int8_embeddings, load_meta
+
+
+class VectorIndex:
+    """Common interface: score() for hybrid search, search() for top-k"""
+
+    name = "base"
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    def score(self, query_vectors):
+        """Max similarity of each chunk to any query vector, clipped at 0"""
+        raise NotImplementedError
+
+    def search(self, query_vectors, k):
+        """Top-k chunk ids and their scores, best first"""
+        scores = self.score(query_vectors)
+        ids = top_k_indices(scores, k)
+        return ids, scores[ids]
+
+
+class ExactIndex(VectorIndex):
+    """Brute-force scan: one (chunks × queries) matrix product"""
+
+    name = "exact"
+
+    def score(self, query_vectors):
+        similarities = self.embeddings @ np.atleast_2d(query_vectors).T
+        return np.maximum(similarities.max(axis=1), 0)
+
+
+def _rescore(embeddings, scores, query_vectors, n):
+    """
+    Replace the n best approximate scores with exact float32 ones
+
+    Sorted ids read the memory-mapped float32 rows in file order.
+    """
+    if n:
+        ids = np.sort(top_k_indices(scores, n))
+        scores[ids] = (embeddings[ids] @ query_vectors.T).max(axis=1)
+    return scores
+
+
+def _spherical_kmeans(vectors, k, n_iter=20, seed=0):
+    """
+    k-means on unit vectors, using dot product as the similarity
+
+    Returns unit-norm centroids. A centroid that loses all its
+    members gets re-seeded from a random vector.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = _assign(vectors, centroids)
+        counts = np.bincount(assign, minlength=k)
+
+        # Sum members per cluster: sort by cluster, then add up each run
+        order = np.argsort(assign, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        empty = counts == 0
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(vectors[order], starts[~empty])
+
+        sums[empty] = vectors[rng.choice(len(vectors), empty.sum())]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+
+    return centroids
+
+
+def _assign(vectors, centroids, block_size=65536):
+    """Nearest centroid for every vector, in blocks to bound memory"""
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+        assign[start:start + block_size] = (block @ centroids.T).argmax(axis=1)
+    return assign
+
+
+class IVFIndex(VectorIndex):
+    """
+    Inverted-file index with a k-means coarse quantizer (IVF-flat)
+
+    Training splits the chunks into nlist clusters. At query time
+    only the nprobe clusters nearest to each query are scanned,
+    with exact dot products for the vectors inside them.
+
+    Cluster membership is stored CSR-style:
+        list_ids[list_offsets[c]:list_offsets[c + 1]] → chunks in cluster c
+    """
+
+    name = "ivf"
+
+    def __init__(self, embeddings, centroids, list_offsets, list_ids, nprobe=IVF_NPROBE):
+        super().__init__(embeddings)
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+        self.nprobe = nprobe
+
+    @classmethod
+    def train(cls, embeddings, nlist=IVF_NLIST, nprobe=IVF_NPROBE,
+              n_iter=20, max_train=100_000, seed=0):
+        """
+        Cluster the embeddings and bucket every chunk
+
+        nlist=0 picks ~4·√n clusters. Training runs on at most
+        max_train sampled vectors; all vectors are then assigned.
+        """
+        n = embeddings.shape[0]
+        if not nlist:
+            nlist = int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n, min(n, max_train), replace=False))
+        centroids = _spherical_kmeans(
+            np.asarray(embeddings[sample], dtype=np.float32), nlist, n_iter, seed
+        )
+
+        assign = _assign(embeddings, centroids)
+        list_ids = np.argsort(assign, kind="stable").astype(np.int32)
+        list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assign, minlength=nlist))]
+        ).astype(np.int64)
+        return cls(embeddings, centroids, list_offsets, list_ids, nprobe)
+
+    def save(self, path=IVF_INDEX_PATH, store_version=0):
+        _savez_atomic(path, centroids=self.centroids, list_offsets=self.list_offsets,
+                      list_ids=self.list_ids, count=len(self), store_version=store_version)
+
+    @classmethod
+    def load(cls, embeddings, path=IVF_INDEX_PATH, nprobe=IVF_NPROBE, store_version=0):
+        """Load a saved index, or None if it doesn't match the embeddings"""
+        if not os.path.exists(path):
+            return None
+        data = np.load(path)
+        if not _matches(data, embeddings, store_version):
+            return None
+        return cls(embeddings, data["centroids"], data["list_offsets"],
+                   data["list_ids"], nprobe)
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    def _probe(self, query_vector):
+        """Chunk ids in the nprobe clusters closest to one query"""
+        nearest = top_k_indices(self.centroids @ query_vector, self.nprobe)
+        return np.concatenate([
+            self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]]
+            for c in nearest
+        ])
+
+    def score(self, query_vectors):
+        scores = np.zeros(len(self), dtype=np.float32)
+        for query_vector in np.atleast_2d(query_vectors):
+            ids = self._probe(query_vector)
+            similarities = self.embeddings[ids] @ query_vector
+            scores[ids] = np.maximum(scores[ids], similarities)
+        return scores
+
+
+class Int8Index(VectorIndex):
+    """
+    Scan int8 codes, then re-score the best candidates in float32
+
+    The full scan reads 1 byte per dimension instead of 4. Only the
+    top `rescore` chunks touch the float32 matrix (which stays
+    memory-mapped on disk), so resident memory is mostly the codes.
+    Chunks outside the re-scored set keep their int8 estimate.
+    """
+
+    name = "int8"
+
+    def __init__(self, embeddings, codes, scale, rescore=INT8_RESCORE_CANDIDATES,
+                 block_size=16384):
+        super().__init__(embeddings)
+        self.codes = codes
+        self.scale = scale
+        self.rescore = rescore
+        self.block_size = block_size
+
+    def approximate_scores(self, query_vectors):
+        """Max int8 similarity per chunk: codes · (query × scale)"""
+        scaled_queries = (np.atleast_2d(query_vectors) * self.scale).T
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), self.block_size):
+            block = np.asarray(self.codes[start:start + self.block_size], dtype=np.float32)
+            scores[start:start + self.block_size] = (block @ scaled_queries).max(axis=1)
+        return scores
+
+    def score(self, query_vectors):
+        query_vectors = np.atleast_2d(query_vectors)
+        scores = self.approximate_scores(query_vectors)
+        scores = _rescore(self.embeddings, scores, query_vectors, self.rescore)
+        return np.maximum(scores, 0)
+
+
+def _kmeans(vectors, k, n_iter=20, seed=0):
+    """
+    Plain (Euclidean) k-means for PQ sub-vectors
+
+    Nearest centroid = argmax(x·c − ½‖c‖²), which avoids building
+    the full distance matrix. Empty clusters are re-seeded.
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = _nearest(vectors, centroids)
+        counts = np.bincount(assign, minlength=k)
+        order = np.argsort(assign, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        empty = counts == 0
+
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(vectors[order], starts[~empty])
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = vectors[rng.choice(len(vectors), empty.sum())]
+
+    return centroids
+
+
+def _nearest(vectors, centroids):
+    half_norms = 0.5 * (centroids ** 2).sum(axis=1)
+    return (vectors @ centroids.T - half_norms).argmax(axis=1)
+
+
+class PQIndex(VectorIndex):
+    """
+    Product quantization with asymmetric distance computation (ADC)
+
+    TRAINING: each 384-dim vector is cut into m sub-vectors (e.g.
+    48 × 8 dims). Every subspace gets its own 256-entry codebook
+    from k-means, and a vector is stored as m one-byte codes:
+    48 bytes instead of 1536.
+
+    SEARCH: the query is NOT quantized (that's the "asymmetric"
+    part). For each subspace we precompute the dot product of the
+    query's sub-vector with all 256 centroids → an (m × 256) table.
+    A chunk's score is then just m table lookups added together.
+
+    With rerank > 0, the best `rerank` chunks are re-scored exactly
+    against the float32 matrix.
+    """
+
+    name = "pq"
+
+    def __init__(self, embeddings, codebooks, codes, rerank=PQ_RERANK_CANDIDATES,
+                 block_size=65536):
+        super().__init__(embeddings)
+        self.codebooks = codebooks      # (m, 256, dim / m) float32
+        self.codes = codes              # (n, m) uint8
+        self.rerank = rerank
+        self.block_size = block_size
+
+    @property
+    def m(self):
+        return self.codebooks.shape[0]
+
+    @classmethod
+    def train(cls, embeddings, m=PQ_SUBSPACES, n_iter=20, max_train=50_000, seed=0):
+        n, dim = embeddings.shape
+        if dim % m:
+            raise ValueError(f"PQ_SUBSPACES={m} must divide the embedding dim {dim}")
+        dsub = dim // m
+
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n, min(n, max_train), replace=False))
+        train = np.asarray(embeddings[sample], dtype=np.float32)
+        codebooks = np.stack([
+            _kmeans(train[:, j * dsub:(j + 1) * dsub], 256, n_iter, seed + j)
+            for j in range(m)
+        ]).astype(np.float32)
+
+        codes = np.empty((n, m), dtype=np.uint8)
+        block_size = 65536
+        for start in range(0, n, block_size):
+            block = np.asarray(embeddings[start:start + block_size], dtype=np.float32)
+            for j in range(m):
+                codes[start:start + block_size, j] = _nearest(
+                    block[:, j * dsub:(j + 1) * dsub], codebooks[j]
+                )
+        return cls(embeddings, codebooks, codes)
+
+    def save(self, path=PQ_INDEX_PATH, store_version=0):
+        _savez_atomic(path, codebooks=self.codebooks, codes=self.codes, count=len(self),
+                      store_version=store_version)
+
+    @classmethod
+    def load(cls, embeddings, path=PQ_INDEX_PATH, store_version=0):
+        """Load a saved index, or None if it doesn't match the embeddings"""
+        if not os.path.exists(path):
+            return None
+        data = np.load(path)
+        if not _matches(data, embeddings, store_version):
+            return None
+        return cls(embeddings, data["codebooks"], data["codes"])
+
+    def distance_table(self, query_vector):
+        """(m × 256) dot products of each query sub-vector with each centroid"""
+        sub_queries = query_vector.reshape(self.m, 1, -1)
+        return (self.codebooks * sub_queries).sum(axis=2)
+
+    def approximate_scores(self, query_vectors):
+        """ADC: sum of m table lookups per chunk, max across queries"""
+        scores = np.full(len(self), -np.inf, dtype=np.float32)
+        subspaces = np.arange(self.m)
+        for query_vector in np.atleast_2d(query_vectors):
+            table = self.distance_table(query_vector)
+            for start in range(0, len(self), self.block_size):
+                block = self.codes[start:start + self.block_size]
+                block_scores = table[subspaces, block].sum(axis=1)
+                np.maximum(scores[start:start + self.block_size], block_scores,
+                           out=scores[start:start + self.block_size])
+        return scores
+
+    def score(self, query_vectors):
+        query_vectors = np.atleast_2d(query_vectors)
+        scores = self.approximate_scores(query_vectors)
+        scores = _rescore(self.embeddings, scores, query_vectors, self.rerank)
+        return np.maximum(scores, 0)
+
+
+def _savez_atomic(path, **arrays):
+    """
+    np.savez via a per-process temp file + rename
+
+    Several API workers may train and save the same index at once; a
+    reader only ever opens a complete file, and the last rename wins.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _matches(data, embeddings, store_version):
+    """A saved index is only reused for the same rows of the same store version"""
+    saved_version = int(data["store_version"]) if "store_version" in data.files else 0
+    return int(data["count"]) == embeddings.shape[0] and saved_version == store_version
+
+
+def load_vector_index(embeddings, backend=VECTOR_INDEX):
+    """
+    Build the configured backend for these embeddings
+
+    IVF and PQ are loaded from data/vectorstore/ when a matching
+    index was saved before, otherwise trained once and saved there.
+    "Matching" includes the store version in meta.json, so an
+    incremental rebuild with the same row count still retrains.
+    02_embed_chunks.py calls this after every rebuild, so API workers
+    normally find the index already trained.
+    """
+    store_version = load_meta().get("store_version", 0)
+
+    if backend == "exact":
+        return ExactIndex(embeddings)
+
+    if backend == "ivf":
+        index = IVFIndex.load(embeddings, store_version=store_version)
+        if index is None:
+            print("Training IVF index (one-time)...")
+            index = IVFIndex.train(embeddings)
+            index.save(store_version=store_version)
+            print(f"✓ Saved IVF index with {index.nlist} lists: {IVF_INDEX_PATH}")
+        return index
+
+    if backend == "int8":
+        codes, scale = load_int8_embeddings(embeddings, store_version=store_version)
+        return Int8Index(embeddings, codes, scale)
+
+    if backend == "pq":
+        index = PQIndex.load(embeddings, store_version=store_version)
+        if index is None:
+            print("Training PQ codebooks (one-time)...")
+            index = PQIndex.train(embeddings)
+            index.save(store_version=store_version)
+            print(f"✓ Saved PQ index ({index.m} bytes/vector): {PQ_INDEX_PATH}")
+        return index
+
+    raise ValueError(f"Unknown VECTOR_INDEX backend: {backend!r}")
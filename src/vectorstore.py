@@ -0,0 +1,208 @@
+"""
+Vector Store
+Loading and saving the embedding matrix plus its metadata
+
+ANALOGY: The filing cabinet that holds every card's location in
+the 384-dimensional room. The metadata sheet taped to the front
+says how the cards were filed, so we know whether a drawer from
+an older version needs re-filing before we use it.
+"""
+import json
+import os
+import pickle
+import shutil
+import numpy as np
+from src.config import (
+    EMBEDDINGS_PATH, VECTORSTORE_META_PATH, CHUNKS_PATH, CHUNK_STORE_DIR,
+    INT8_EMBEDDINGS_PATH, INT8_SCALE_PATH
+)
+from src.chunk_store import ChunkStore, write_chunk_store
+
+
+def normalize_rows(matrix):
+    """
+    Scale every row to unit length (float32)
+
+    WHY: cosine similarity = dot product / (norm × norm). If every
+    vector already has norm 1, cosine similarity IS the dot product,
+    so search never has to recompute norms. All-zero rows stay zero.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def load_meta(path=VECTORSTORE_META_PATH):
+    """Read the vector store metadata (empty dict for older stores)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_meta(meta, path=VECTORSTORE_META_PATH):
+    with open(path, "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def save_embeddings(embeddings, path=EMBEDDINGS_PATH, meta_path=VECTORSTORE_META_PATH,
+                    **extra_meta):
+    """Normalize, save as float32, and record that in the metadata"""
+    embeddings = normalize_rows(embeddings)
+    np.save(path, embeddings)
+    _record_embeddings(embeddings.shape, meta_path, extra_meta)
+    return embeddings
+
+
+def commit_embeddings(staged_path, path=EMBEDDINGS_PATH, meta_path=VECTORSTORE_META_PATH,
+                      rows=None, **extra_meta):
+    """
+    Move a fully written unit-norm float32 .npy into place and record it
+
+    For matrices streamed to disk (e.g. with open_memmap) that are too
+    big to hand to save_embeddings. The rename is atomic: processes
+    that still have the old file mapped keep reading the old rows.
+
+    rows identifies what the rows hold (see manifest.rows_hash). It is
+    recorded BEFORE the rename: if the process dies in between, the
+    metadata names rows that aren't on disk, so nothing trusts the old
+    file's rows — they are re-embedded, never paired with wrong chunks.
+    """
+    shape = np.load(staged_path, mmap_mode="r").shape
+    if rows is not None:
+        meta = load_meta(meta_path)
+        meta["rows"] = rows
+        save_meta(meta, meta_path)
+    os.replace(staged_path, path)
+    _record_embeddings(shape, meta_path, extra_meta)
+    return np.load(path, mmap_mode="r")
+
+
+def replace_directory(staged_dir, path):
+    """
+    Swap a fully written directory in for path
+
+    The old directory is renamed aside, the new one renamed into
+    place, and only then is the old one deleted. Files are never
+    rewritten in place, so processes that have the old ones mapped
+    keep reading them until they reopen.
+    """
+    staged_dir, path = str(staged_dir), str(path)
+    old_dir = path + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_dir)
+    os.rename(staged_dir, path)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _record_embeddings(shape, meta_path, extra_meta):
+    meta = load_meta(meta_path)
+    meta.update(extra_meta)
+    meta.update({
+        "normalized": True,
+        "dtype": "float32",
+        "count": int(shape[0]),
+        "dim": int(shape[1]),
+    })
+    save_meta(meta, meta_path)
+
+
+def load_embeddings(path=EMBEDDINGS_PATH, meta_path=VECTORSTORE_META_PATH):
+    """
+    Open the unit-norm float32 embedding matrix, memory-mapped
+
+    WHY MMAP: every API worker process maps the same file, so they
+    all share one copy in the OS page cache instead of each holding
+    a private 13k × 384 matrix. Nothing is read until it's used.
+
+    Stores written before normalization was recorded in the metadata
+    get normalized once here and saved back, so the next load is free.
+    """
+    if not load_meta(meta_path).get("normalized"):
+        print("Upgrading vector store to unit-norm float32 embeddings...")
+        embeddings = save_embeddings(np.load(path), path, meta_path)
+        print(f"✓ Normalized and saved {embeddings.shape[0]} vectors")
+
+    return np.load(path, mmap_mode="r")
+
+
+def quantize_int8(embeddings, block_size=65536):
+    """
+    Scalar-quantize unit vectors to int8 with a per-dimension scale
+
+    Each dimension is mapped onto -127..127 using its largest
+    absolute value across the corpus:
+        code = round(value / scale),  value ≈ code × scale
+    4× smaller than float32, at a small cost in precision.
+    """
+    scale = np.zeros(embeddings.shape[1], dtype=np.float32)
+    for start in range(0, len(embeddings), block_size):
+        block = np.abs(np.asarray(embeddings[start:start + block_size]))
+        scale = np.maximum(scale, block.max(axis=0))
+    scale = scale / 127
+    scale[scale == 0] = 1.0
+
+    codes = np.empty(embeddings.shape, dtype=np.int8)
+    for start in range(0, len(embeddings), block_size):
+        block = np.asarray(embeddings[start:start + block_size]) / scale
+        codes[start:start + block_size] = np.clip(np.round(block), -127, 127)
+    return codes, scale.astype(np.float32)
+
+
+def _save_npy_atomic(path, array):
+    """np.save via a temp file + rename, so mapped readers never see a half-written file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def save_int8_embeddings(embeddings, path=INT8_EMBEDDINGS_PATH, scale_path=INT8_SCALE_PATH,
+                         meta_path=VECTORSTORE_META_PATH, store_version=0):
+    """Quantize and save; the store version they came from goes in the metadata"""
+    codes, scale = quantize_int8(embeddings)
+    _save_npy_atomic(path, codes)
+    _save_npy_atomic(scale_path, scale)
+    meta = load_meta(meta_path)
+    meta["int8_store_version"] = store_version
+    save_meta(meta, meta_path)
+    return codes, scale
+
+
+def load_int8_embeddings(embeddings, path=INT8_EMBEDDINGS_PATH, scale_path=INT8_SCALE_PATH,
+                         meta_path=VECTORSTORE_META_PATH, store_version=0):
+    """
+    Open the int8 codes (memory-mapped) and their scale
+
+    Quantized from the float32 matrix and saved once if they're
+    missing or don't match it (shape and store version, since a
+    rebuild can keep the row count).
+    """
+    if os.path.exists(path) and os.path.exists(scale_path):
+        codes = np.load(path, mmap_mode="r")
+        saved_version = load_meta(meta_path).get("int8_store_version", 0)
+        if codes.shape == embeddings.shape and saved_version == store_version:
+            return codes, np.load(scale_path)
+
+    print("Quantizing embeddings to int8 (one-time)...")
+    save_int8_embeddings(embeddings, path, scale_path, meta_path, store_version)
+    print(f"✓ Saved int8 embeddings: {path}")
+    return np.load(path, mmap_mode="r"), np.load(scale_path)
+
+
+def load_chunks(directory=CHUNK_STORE_DIR, legacy_path=CHUNKS_PATH):
+    """
+    Open the memory-mapped chunk store
+
+    Vector stores from before the chunk store only have chunks.pkl;
+    that gets converted once here.
+    """
+    if not ChunkStore.exists(directory):
+        print("Upgrading vector store: converting chunks.pkl to a chunk store...")
+        with open(legacy_path, "rb") as f:
+            write_chunk_store(directory, pickle.load(f))
+        print(f"✓ Wrote chunk store: {directory}")
+
+    return ChunkStore(directory)